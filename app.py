@@ -1,15 +1,32 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory, Response, stream_with_context, abort
+from flask.sessions import SecureCookieSessionInterface
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.exc import IntegrityError
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import os
 import secrets
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import uuid
 import hashlib
-from collections import deque
+import csv
+import io
+import json
+import zlib
+import time
+import threading
+import mimetypes
+import heapq
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque, OrderedDict
+from functools import lru_cache
+from itertools import islice
+from abc import ABC, abstractmethod
+from message_log import SegmentedMessageLog, ROOM_ID_PATTERN
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secrets.token_hex(16)
@@ -18,10 +35,61 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 app.config['ALLOWED_EXTENSIONS'] = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx'}
+app.config['EXPORT_BATCH_SIZE'] = 1000  # rows fetched per keyset page during exports
+app.config['STATS_CACHE_TTL'] = 10  # seconds the admin dashboard stats are reused
+app.config['USER_CACHE_SIZE'] = 4096  # identities kept by load_user
+app.config['USER_CACHE_TTL'] = 300  # seconds before a cached identity is re-read
+app.config['USER_CACHE_SYNC_INTERVAL'] = 2  # seconds between checks for invalidations from other workers
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_HASH_EXECUTOR'] = os.environ.get('PASSWORD_HASH_EXECUTOR', 'process')  # process, thread or inline
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_QUEUE_LIMIT'] = app.config['PASSWORD_HASH_WORKERS'] * 8  # in-flight hashes before refusing
+app.config['PASSWORD_HASH_TIMEOUT'] = 10  # seconds to wait for a hash result
+app.config['RESYNC_MAX_GAP'] = 50  # missed messages served as a delta before a full refetch
+app.config['ASSET_DIST_FOLDER'] = os.path.join(app.static_folder, 'dist')  # output of build_assets.py
+app.config['MESSAGE_STORE'] = os.environ.get('MESSAGE_STORE', 'sql')  # sql or log
+app.config['MESSAGE_LOG_FOLDER'] = os.environ.get('MESSAGE_LOG_FOLDER', 'message_log')
+app.config['MESSAGE_LOG_SEGMENT_BYTES'] = 8 * 1024 * 1024
+app.config['MESSAGE_LOG_FSYNC'] = False
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 
+def load_asset_manifest():
+    """Map source asset paths to their fingerprinted builds, if built"""
+    manifest_path = os.path.join(app.config['ASSET_DIST_FOLDER'], 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+asset_manifest = load_asset_manifest()
+
+
+class PublicAssetSessionInterface(SecureCookieSessionInterface):
+    """Leave the session alone on /assets/ responses.
+
+    Flask-Login reads the session after every request, which would add
+    Vary: Cookie and keep shared caches from storing the public assets.
+    """
+
+    def save_session(self, app, session, response):
+        if request.endpoint == 'get_asset':
+            return
+        super().save_session(app, session, response)
+
+app.session_interface = PublicAssetSessionInterface()
+
+
+@app.context_processor
+def inject_asset_url():
+    def asset_url(filename):
+        if filename in asset_manifest:
+            return url_for('get_asset', filename=asset_manifest[filename])
+        return url_for('static', filename=filename)
+    return {'asset_url': asset_url}
+
+
 db = SQLAlchemy(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
 login_manager = LoginManager(app)
@@ -35,6 +103,23 @@ max_cache_size = 100
 user_sessions = {}
 
 
+stats_cache = {'data': None, 'expires_at': 0}
+
+
+# user_id -> (expires_at, column snapshot), kept in LRU order
+user_cache = OrderedDict()
+user_cache_lock = threading.Lock()
+user_cache_invalidators = []
+user_cache_sync = {'version': None, 'checked_at': 0}
+
+
+password_pool = {'executor': None, 'slots': None, 'lock': threading.Lock()}
+
+
+class PasswordHashBusy(Exception):
+    """Raised when the password hashing pool is saturated or too slow"""
+
+
 class RoomNode:
     def __init__(self, name, parent=None):
         self.name = name
@@ -56,6 +141,69 @@ class RoomNode:
 room_tree = RoomNode("Global")
 
 
+class UsernameTrie:
+    """Prefix index over lowercased usernames (DSA: Trie)"""
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def _walk(self, key):
+        node = self.root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+    def insert(self, username, user_id):
+        node = self.root
+        for char in username.lower():
+            node = node.setdefault(char, {})
+        entries = node.setdefault(None, {})
+        if user_id not in entries:
+            self.size += 1
+        entries[user_id] = username
+
+    def remove(self, username, user_id):
+        node = self._walk(username.lower())
+        if node is not None and user_id in node.get(None, {}):
+            del node[None][user_id]
+            self.size -= 1
+
+    def search(self, prefix, after=None, limit=50):
+        """Return up to `limit` (key, user_id, username) tuples in key order.
+
+        `after` is a (key, user_id) cursor; whole subtrees that sort before
+        it are skipped rather than walked.
+        """
+        prefix = prefix.lower()
+        start = self._walk(prefix)
+        if start is None:
+            return []
+
+        results = []
+        stack = [(prefix, start)]
+        while stack and len(results) < limit:
+            path, node = stack.pop()
+            for user_id, username in sorted(node.get(None, {}).items()):
+                if after and (path, user_id) <= after:
+                    continue
+                results.append((path, user_id, username))
+                if len(results) == limit:
+                    break
+            children = sorted((char for char in node if char is not None), reverse=True)
+            for char in children:
+                child_path = path + char
+                if after and child_path < after[0][:len(child_path)]:
+                    continue
+                stack.append((child_path, node[char]))
+        return results
+
+
+user_index = {'trie': None, 'version': None}
+
+
 class User(db.Model, UserMixin):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     username = db.Column(db.String(50), unique=True, nullable=False)
@@ -68,10 +216,13 @@ class User(db.Model, UserMixin):
     messages = db.relationship('Message', backref='author', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return self.password_hash.split('$', 1)[0] != stored_hash_method(app.config['PASSWORD_HASH_METHOD'])
     
     def to_dict(self):
         return {
@@ -150,6 +301,11 @@ class DirectMessage(db.Model):
             'is_read': self.is_read
         }
 
+class StateVersion(db.Model):
+    """Shared counters bumped on writes, so every worker can tell when its in-memory copy is stale"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -168,10 +324,13 @@ def get_unique_filename(filename):
     return f"{name}_{uuid.uuid4().hex[:8]}{ext}"
 
 def add_message_to_cache(room_id, message):
-    """Add message to room-specific cache (DSA: Queue)"""
-    if room_id not in message_cache:
-        message_cache[room_id] = deque(maxlen=max_cache_size)
-    message_cache[room_id].append(message)
+    """Add message to room-specific cache (DSA: Queue)
+
+    Only rooms already seeded by load_recent_messages are appended to, so a
+    cache always holds a contiguous tail of the room's history.
+    """
+    if room_id in message_cache:
+        message_cache[room_id].append(message)
 
 def get_cached_messages(room_id, limit=50):
     """Get recent messages from cache"""
@@ -180,9 +339,645 @@ def get_cached_messages(room_id, limit=50):
         return messages[-limit:] if len(messages) > limit else messages
     return []
 
+def get_password_executor():
+    """Create the password hashing pool on first use; returns (executor, queue slots)"""
+    with password_pool['lock']:
+        if password_pool['executor'] is None:
+            workers = app.config['PASSWORD_HASH_WORKERS']
+            if app.config['PASSWORD_HASH_EXECUTOR'] == 'process':
+                password_pool['executor'] = ProcessPoolExecutor(max_workers=workers)
+            else:
+                password_pool['executor'] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            password_pool['slots'] = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE_LIMIT'])
+        return password_pool['executor'], password_pool['slots']
+
+def reset_password_executor(broken):
+    """Replace a pool that lost a worker process (e.g. OOM-killed mid-scrypt)"""
+    with password_pool['lock']:
+        # Another request may already have replaced it
+        if password_pool['executor'] is broken:
+            password_pool['executor'] = None
+            password_pool['slots'] = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def run_password_task(func, *args):
+    """Run a CPU-heavy hash function off the request worker, bounded by the queue limit"""
+    if app.config['PASSWORD_HASH_EXECUTOR'] == 'inline':
+        return func(*args)
+
+    # A broken pool is replaced and the task retried once on the new one
+    for _ in range(2):
+        executor, slots = get_password_executor()
+        if not slots.acquire(blocking=False):
+            raise PasswordHashBusy("Password hashing queue is full")
+
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            slots.release()
+            reset_password_executor(executor)
+            continue
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _, slots=slots: slots.release())
+
+        try:
+            return future.result(timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHashBusy("Password hashing timed out")
+        except BrokenProcessPool:
+            reset_password_executor(executor)
+    raise PasswordHashBusy("Password hashing pool is restarting")
+
+@lru_cache(maxsize=None)
+def stored_hash_method(method):
+    """The method prefix werkzeug stores for `method`, with defaults expanded
+
+    e.g. 'pbkdf2:sha256' is stored as 'pbkdf2:sha256:1000000'. Probed with a
+    real hash, so it runs on the hashing pool like any other.
+    """
+    return run_password_task(generate_password_hash, '', method).split('$', 1)[0]
+
+def hash_password(password):
+    return run_password_task(generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+def verify_password(password_hash, password):
+    return run_password_task(check_password_hash, password_hash, password)
+
+def load_recent_messages(room_id, limit=50):
+    """Latest messages for a room, oldest first, seeding the cache on a miss"""
+    if room_id in message_cache:
+        return get_cached_messages(room_id, limit)
+
+    messages = Message.query.filter_by(room_id=room_id)\
+        .order_by(Message.timestamp.desc(), Message.id.desc()).limit(max_cache_size).all()
+    result = [message.to_dict() for message in reversed(messages)]
+
+    message_cache[room_id] = deque(result, maxlen=max_cache_size)
+    return result[-limit:]
+
+def get_messages_since(room_id, since_id, limit):
+    """Messages after `since_id`, or None when the gap can't be served as a delta"""
+    cached = list(message_cache.get(room_id, ()))
+    for index, message in enumerate(cached):
+        if message.get('id') == since_id:
+            missed = cached[index + 1:]
+            return missed if len(missed) <= limit else None
+
+    anchor = Message.query.filter_by(id=since_id, room_id=room_id).first()
+    if not anchor:
+        return None
+
+    missed = Message.query.filter(
+        Message.room_id == room_id,
+        db.or_(
+            Message.timestamp > anchor.timestamp,
+            db.and_(Message.timestamp == anchor.timestamp, Message.id > anchor.id)
+        )
+    ).order_by(Message.timestamp, Message.id).limit(limit + 1).all()
+    if len(missed) > limit:
+        return None
+    return [message.to_dict() for message in missed]
+
+class MessageStore(ABC):
+    """Storage for room messages, used by handle_message, get_messages and on_join"""
+
+    @abstractmethod
+    def append(self, room_id, user, content, is_file=False, file_path=None):
+        """Persist a room message and return its client-facing dict"""
+
+    @abstractmethod
+    def recent(self, room_id, limit=50):
+        """Latest messages for a room, oldest first"""
+
+    @abstractmethod
+    def since(self, room_id, since_id, limit):
+        """Messages after `since_id`, or None when the gap can't be served as a delta"""
+
+    @abstractmethod
+    def delete_room(self, room_id):
+        """Remove every message of a room"""
+
+    # Admin views below are dicts with room_id, user_id and a created_at
+    # datetime on top of the client fields
+
+    @abstractmethod
+    def get(self, message_id):
+        """Admin view of one message, or None"""
+
+    @abstractmethod
+    def delete(self, message_id):
+        """Delete one message and return its admin view, or None if not found"""
+
+    @abstractmethod
+    def page(self, room_id=None, user_id=None, page=1, per_page=20):
+        """(client dicts, total) for one page of messages, newest first"""
+
+    @abstractmethod
+    def iter_records(self, room_id=None, user_id=None, since=None, until=None, files_only=False):
+        """Admin views in created_at order, streamed for exports"""
+
+    @abstractmethod
+    def stats(self, since):
+        """Message and file totals plus {room_id: (messages, active users)} since `since`"""
+
+
+class SQLMessageStore(MessageStore):
+    """Message rows through SQLAlchemy, fronted by message_cache"""
+
+    def append(self, room_id, user, content, is_file=False, file_path=None):
+        message = Message(
+            content=content,
+            is_file=is_file,
+            file_path=file_path,
+            user_id=user.id,
+            room_id=room_id
+        )
+        db.session.add(message)
+        db.session.flush()
+        # Serialize before commit expires current_user, which would re-SELECT it
+        message_dict = message.to_dict()
+        db.session.commit()
+
+        add_message_to_cache(room_id, message_dict)
+        return message_dict
+
+    def recent(self, room_id, limit=50):
+        return load_recent_messages(room_id, limit)
+
+    def since(self, room_id, since_id, limit):
+        return get_messages_since(room_id, since_id, limit)
+
+    def delete_room(self, room_id):
+        Message.query.filter_by(room_id=room_id).delete()
+        message_cache.pop(room_id, None)
+
+    def _record(self, message):
+        return dict(message.to_dict(), room_id=message.room_id, user_id=message.user_id,
+                    created_at=message.timestamp)
+
+    def get(self, message_id):
+        message = Message.query.get(message_id)
+        return self._record(message) if message else None
+
+    def delete(self, message_id):
+        message = Message.query.get(message_id)
+        if not message:
+            return None
+        record = self._record(message)
+
+        if message.room_id in message_cache:
+            message_cache[message.room_id] = deque(
+                [m for m in message_cache[message.room_id] if m.get('id') != message_id],
+                maxlen=max_cache_size
+            )
+
+        db.session.delete(message)
+        db.session.commit()
+        return record
+
+    def page(self, room_id=None, user_id=None, page=1, per_page=20):
+        query = Message.query
+        if room_id:
+            query = query.filter_by(room_id=room_id)
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+
+        messages = query.order_by(Message.timestamp.desc()).paginate(page=page, per_page=per_page)
+        return [message.to_dict() for message in messages.items], messages.total
+
+    def iter_records(self, room_id=None, user_id=None, since=None, until=None, files_only=False):
+        query = db.session.query(
+            Message.id, Message.timestamp, Message.room_id, Message.user_id, User.username,
+            Message.content, Message.is_file, Message.file_path
+        ).join(User, Message.user_id == User.id)
+        if room_id:
+            query = query.filter(Message.room_id == room_id)
+        if user_id:
+            query = query.filter(Message.user_id == user_id)
+        if files_only:
+            query = query.filter(Message.is_file.is_(True))
+
+        fields = ['id', 'created_at', 'room_id', 'user_id', 'username', 'content', 'is_file', 'file_path']
+        for row in iter_keyset(query, Message, since, until):
+            yield dict(zip(fields, row))
+
+    def stats(self, since):
+        activity = db.session.query(
+            Message.room_id,
+            db.func.count(Message.id),
+            db.func.count(db.distinct(Message.user_id))
+        ).filter(Message.timestamp >= since).group_by(Message.room_id).all()
+
+        return {
+            'messages': db.session.query(db.func.count(Message.id)).scalar(),
+            'files': db.session.query(db.func.count(Message.id)).filter(Message.is_file.is_(True)).scalar(),
+            'activity': {room_id: (count, users) for room_id, count, users in activity}
+        }
+
+
+class SegmentLogMessageStore(MessageStore):
+    """Room messages in append-only, memory-mapped segment files (see message_log.py).
+
+    Message ids are "<room_id>:<seq>", so a resync cursor maps straight to
+    a position in the room's log. Admin deletes tombstone the record. Each
+    record is tagged with its author and, for uploads, 'files', so admin
+    counts and filtered views read the tag sidecars instead of whole logs.
+    """
+
+    def __init__(self, log):
+        self.log = log
+
+    def _to_dict(self, room_id, seq, record):
+        # user_id is kept in the log for moderation but, as in Message.to_dict(),
+        # not sent to clients
+        message = {key: value for key, value in record.items() if key != 'user_id'}
+        message['id'] = f"{room_id}:{seq}"
+        return message
+
+    def append(self, room_id, user, content, is_file=False, file_path=None):
+        return self._append(room_id, user.id, user.username, content, is_file, file_path, datetime.utcnow())
+
+    def import_record(self, record):
+        """Copy an admin view from another store, keeping its timestamp (see migrate_message_log.py)"""
+        return self._append(record['room_id'], record['user_id'], record['username'], record['content'],
+                            record['is_file'], record['file_path'], record['created_at'])
+
+    def _append(self, room_id, user_id, username, content, is_file, file_path, created_at):
+        record = {
+            'content': content,
+            'timestamp': created_at.strftime("%H:%M:%S"),
+            'date': created_at.strftime("%Y-%m-%d"),
+            'username': username,
+            'user_id': user_id,
+            'is_file': is_file,
+            'file_path': file_path if is_file else None
+        }
+        seq = self.log.append(room_id, record, tags=self._tags(record))
+        return self._to_dict(room_id, seq, record)
+
+    def _tags(self, record):
+        tags = []
+        if ROOM_ID_PATTERN.fullmatch(record['user_id']):
+            tags.append(f"user-{record['user_id']}")
+        if record['is_file']:
+            tags.append('files')
+        return tags
+
+    def recent(self, room_id, limit=50):
+        return [self._to_dict(room_id, seq, record) for seq, record in self.log.tail(room_id, limit)]
+
+    def since(self, room_id, since_id, limit):
+        if not isinstance(since_id, str):
+            return None
+        log_room, _, seq = since_id.rpartition(':')
+        if log_room != room_id or not seq.isdigit():
+            return None
+        start = int(seq) + 1
+        end = self.log.next_seq(room_id)
+        # Measured in sequence numbers, so deleted records still count
+        # towards the gap and the delta can't stop short of the tail
+        if start > end or end - start > limit:
+            return None
+        return [self._to_dict(room_id, seq, record) for seq, record in self.log.read(room_id, start, end)]
+
+    def delete_room(self, room_id):
+        self.log.drop_room(room_id)
+        # Rows written before the store was switched to the log
+        Message.query.filter_by(room_id=room_id).delete()
+
+    def _record(self, room_id, seq, record):
+        return dict(record, id=f"{room_id}:{seq}", room_id=room_id,
+                    created_at=datetime.strptime(f"{record['date']} {record['timestamp']}", "%Y-%m-%d %H:%M:%S"))
+
+    def _locate(self, message_id):
+        room_id, _, seq = message_id.rpartition(':')
+        # Only look up rooms that have a log, so unknown ids don't create one
+        if not seq.isdigit() or room_id not in self.log.room_ids():
+            return None
+        return room_id, int(seq)
+
+    def _room_ids(self, room_id=None):
+        room_ids = self.log.room_ids()
+        if room_id:
+            return [room_id] if room_id in room_ids else []
+        return room_ids
+
+    def _user_seqs(self, room_id, user_id):
+        if not ROOM_ID_PATTERN.fullmatch(user_id):
+            return []
+        return self.log.tagged(room_id, f"user-{user_id}")
+
+    def _walk(self, room_id, seqs=None, newest_first=False, batch_size=256):
+        """Admin views of a room's live messages (or just `seqs`), decoded a batch at a time"""
+        if seqs is None:
+            end = self.log.next_seq(room_id)
+            starts = range(0, end, batch_size)
+            if newest_first:
+                starts = reversed(starts)
+            for start in starts:
+                batch = self.log.read(room_id, start, min(start + batch_size, end))
+                for seq, record in reversed(batch) if newest_first else batch:
+                    yield self._record(room_id, seq, record)
+            return
+
+        starts = range(0, len(seqs), batch_size)
+        if newest_first:
+            starts = reversed(starts)
+        for start in starts:
+            chunk = seqs[start:start + batch_size]
+            for seq, record in self.log.read_seqs(room_id, reversed(chunk) if newest_first else chunk):
+                yield self._record(room_id, seq, record)
+
+    def get(self, message_id):
+        location = self._locate(message_id)
+        if not location:
+            return None
+        room_id, seq = location
+        records = self.log.read(room_id, seq, seq + 1)
+        return self._record(room_id, seq, records[0][1]) if records else None
+
+    def delete(self, message_id):
+        record = self.get(message_id)
+        if record and self.log.delete(*self._locate(message_id)):
+            return record
+        return None
+
+    def page(self, room_id=None, user_id=None, page=1, per_page=20):
+        start = max(page - 1, 0) * per_page
+        total, walks = 0, []
+        for log_room in self._room_ids(room_id):
+            seqs = self._user_seqs(log_room, user_id) if user_id else None
+            total += len(seqs) if user_id else self.log.count(log_room)
+            walks.append(self._walk(log_room, seqs, newest_first=True, batch_size=max(per_page, 1)))
+
+        # Each room is walked back from its tail only as far as this page needs
+        newest = heapq.merge(*walks, key=lambda record: record['created_at'], reverse=True)
+        return [self._client(record) for record in islice(newest, start, start + max(per_page, 0))], total
+
+    def _client(self, record):
+        return {key: value for key, value in record.items()
+                if key not in ('user_id', 'room_id', 'created_at')}
+
+    def iter_records(self, room_id=None, user_id=None, since=None, until=None, files_only=False):
+        walks = []
+        for log_room in self._room_ids(room_id):
+            seqs = self._user_seqs(log_room, user_id) if user_id else None
+            if files_only:
+                files = self.log.tagged(log_room, 'files')
+                seqs = files if seqs is None else sorted(set(seqs).intersection(files))
+            walks.append(self._walk(log_room, seqs, batch_size=app.config['EXPORT_BATCH_SIZE']))
+
+        records = heapq.merge(*walks, key=lambda record: record['created_at'])
+        return (record for record in records
+                if (not since or record['created_at'] >= since) and (not until or record['created_at'] < until))
+
+    def stats(self, since):
+        totals = {'messages': 0, 'files': 0, 'activity': {}}
+        for room_id in self.log.room_ids():
+            totals['messages'] += self.log.count(room_id)
+            totals['files'] += len(self.log.tagged(room_id, 'files'))
+
+            # Only the window is decoded, walking back from the tail
+            recent, users = 0, set()
+            for record in self._walk(room_id, newest_first=True):
+                if record['created_at'] < since:
+                    break
+                recent += 1
+                users.add(record['user_id'])
+            if recent:
+                totals['activity'][room_id] = (recent, len(users))
+        return totals
+
+
+def create_message_store():
+    if app.config['MESSAGE_STORE'] == 'log':
+        log = SegmentedMessageLog(
+            app.config['MESSAGE_LOG_FOLDER'],
+            segment_max_bytes=app.config['MESSAGE_LOG_SEGMENT_BYTES'],
+            fsync=app.config['MESSAGE_LOG_FSYNC']
+        )
+        return SegmentLogMessageStore(log)
+    return SQLMessageStore()
+
+message_store = create_message_store()
+
+def check_message_log_backfill():
+    """Refuse to serve from the log while the messages table holds rows never copied into it"""
+    if get_state_version('message_log_backfill') == 0 and db.session.query(Message.id).first():
+        raise RuntimeError(
+            "MESSAGE_STORE=log but existing room messages are only in the database; "
+            "run `python migrate_message_log.py` first"
+        )
+
+def search_user_directory(prefix='', after='', limit=50):
+    """One compact page of the user directory plus the cursor for the next"""
+    cursor = None
+    if after:
+        key, _, user_id = after.rpartition('|')
+        cursor = (key, user_id)
+
+    results = get_user_index().search(prefix, after=cursor, limit=limit)
+    next_cursor = None
+    if len(results) == limit:
+        key, user_id, _ = results[-1]
+        next_cursor = f"{key}|{user_id}"
+
+    return {
+        'users': [{'id': user_id, 'username': username} for _, user_id, username in results],
+        'next': next_cursor
+    }
+
+def get_unread_counts(user_id):
+    """Unread direct messages per sender"""
+    rows = db.session.query(DirectMessage.sender_id, db.func.count(DirectMessage.id))\
+        .filter_by(recipient_id=user_id, is_read=False)\
+        .group_by(DirectMessage.sender_id).all()
+    return {sender_id: count for sender_id, count in rows}
+
+def build_bootstrap(user_id, known_versions=None):
+    """Everything the chat page needs on connect, omitting sections the client already has.
+
+    Each section is versioned by a hash of its content, so versions agree
+    across workers and restarts and a returning client gets "not modified"
+    (the section is left out) whenever its copy is still current.
+    """
+    if not isinstance(known_versions, dict):
+        known_versions = {}
+    sections = {
+        'rooms': [room.to_dict() for room in Room.query.filter_by(is_private=False).all()],
+        'users': search_user_directory(),
+        'unread': get_unread_counts(user_id),
+        'presence': sorted(set(user_sessions.values()))
+    }
+
+    payload = {'versions': {}}
+    for name, data in sections.items():
+        version = hashlib.md5(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+        payload['versions'][name] = version
+        if known_versions.get(name) != version:
+            payload[name] = data
+    return payload
+
+def get_upload_storage_bytes():
+    """Total size of files in the upload folder"""
+    total = 0
+    with os.scandir(app.config['UPLOAD_FOLDER']) as entries:
+        for entry in entries:
+            if entry.is_file():
+                total += entry.stat().st_size
+    return total
+
+def compute_admin_stats():
+    """Aggregate dashboard counts with COUNT/GROUP BY queries"""
+    since = datetime.utcnow() - timedelta(hours=1)
+    message_stats = message_store.stats(since)
+    activity = message_stats['activity']
+
+    rooms = []
+    for room_id, name in db.session.query(Room.id, Room.name).all():
+        messages_last_hour, active_users = activity.get(room_id, (0, 0))
+        rooms.append({
+            'id': room_id,
+            'name': name,
+            'messages_last_hour': messages_last_hour,
+            'active_users': active_users
+        })
+    rooms.sort(key=lambda r: r['messages_last_hour'], reverse=True)
+
+    dm_files = db.session.query(db.func.count(DirectMessage.id)).filter(DirectMessage.is_file.is_(True)).scalar()
+
+    return {
+        'users': db.session.query(db.func.count(User.id)).scalar(),
+        'rooms': len(rooms),
+        'messages': message_stats['messages'],
+        'direct_messages': db.session.query(db.func.count(DirectMessage.id)).scalar(),
+        'files': message_stats['files'] + dm_files,
+        'storage_bytes': get_upload_storage_bytes(),
+        'online_users': len(set(user_sessions.values())),
+        'room_activity': rooms,
+        'generated_at': datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def get_admin_stats():
+    """Return dashboard stats, recomputing at most once per STATS_CACHE_TTL"""
+    now = time.monotonic()
+    if stats_cache['data'] is None or now >= stats_cache['expires_at']:
+        stats_cache['data'] = compute_admin_stats()
+        stats_cache['expires_at'] = now + app.config['STATS_CACHE_TTL']
+    return stats_cache['data']
+
+def invalidate_admin_stats():
+    """Drop cached dashboard stats after an admin mutation"""
+    stats_cache['data'] = None
+
+def get_state_version(name):
+    return db.session.query(StateVersion.value).filter_by(name=name).scalar() or 0
+
+def bump_state_version(name):
+    """Increment a shared version and return its new value"""
+    updated = StateVersion.query.filter_by(name=name).update({StateVersion.value: StateVersion.value + 1})
+    if not updated:
+        db.session.add(StateVersion(name=name, value=1))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the row first
+        db.session.rollback()
+        return bump_state_version(name)
+    return get_state_version(name)
+
+def get_user_index():
+    """Build the username trie from the database, again whenever any worker changed a user"""
+    version = get_state_version('user_directory')
+    if user_index['trie'] is None or user_index['version'] != version:
+        trie = UsernameTrie()
+        for user_id, username in db.session.query(User.id, User.username).all():
+            trie.insert(username, user_id)
+        user_index['trie'] = trie
+        user_index['version'] = version
+    return user_index['trie']
+
+def index_user_change(old_username=None, new_username=None, user_id=None):
+    """Keep the username trie in step with a signup, rename or delete"""
+    version = bump_state_version('user_directory')
+    # Patch our trie in place unless another worker changed users in between,
+    # in which case the version mismatch makes get_user_index rebuild it
+    if user_index['trie'] is not None and user_index['version'] == version - 1:
+        if old_username:
+            user_index['trie'].remove(old_username, user_id)
+        if new_username:
+            user_index['trie'].insert(new_username, user_id)
+        user_index['version'] = version
+
+def register_user_cache_invalidator(callback):
+    """Register a callback(user_id) that propagates invalidations to other workers"""
+    user_cache_invalidators.append(callback)
+    return callback
+
+def invalidate_cached_user(user_id, propagate=True):
+    """Drop a cached identity after its user row changes"""
+    with user_cache_lock:
+        user_cache.pop(user_id, None)
+    if propagate:
+        for callback in user_cache_invalidators:
+            callback(user_id)
+
+@register_user_cache_invalidator
+def publish_user_invalidation(user_id):
+    """Bump the shared identity version so other workers drop their cached users"""
+    version = bump_state_version('user_identity')
+    with user_cache_lock:
+        # Our own bump needs no flush unless another worker's landed in between
+        if user_cache_sync['version'] == version - 1:
+            user_cache_sync['version'] = version
+
+def sync_user_cache():
+    """Drop every cached identity once another worker has invalidated one"""
+    now = time.monotonic()
+    if now - user_cache_sync['checked_at'] < app.config['USER_CACHE_SYNC_INTERVAL']:
+        return
+    version = get_state_version('user_identity')
+    with user_cache_lock:
+        user_cache_sync['checked_at'] = now
+        if version != user_cache_sync['version']:
+            user_cache.clear()
+            user_cache_sync['version'] = version
+
+def cache_user(user):
+    snapshot = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+    with user_cache_lock:
+        user_cache[user.id] = (time.monotonic() + app.config['USER_CACHE_TTL'], snapshot)
+        user_cache.move_to_end(user.id)
+        while len(user_cache) > app.config['USER_CACHE_SIZE']:
+            user_cache.popitem(last=False)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    """Resolve the session user, from the identity cache when possible (DSA: LRU Cache)"""
+    sync_user_cache()
+    # Lookup and LRU bump must be atomic against concurrent invalidation/eviction
+    with user_cache_lock:
+        entry = user_cache.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            user_cache.move_to_end(user_id)
+        else:
+            entry = None
+
+    if entry:
+        # Rebuild a detached instance and attach it without a SELECT
+        user = User(**entry[1])
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = User.query.get(user_id)
+    if user:
+        cache_user(user)
+    else:
+        invalidate_cached_user(user_id, propagate=False)
+    return user
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -195,10 +990,19 @@ def login():
         password = request.form.get('password')
         
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
-            login_user(user)
-            next_page = request.args.get('next')
-            return redirect(next_page or url_for('index'))
+        try:
+            if user and user.check_password(password):
+                # Upgrade hashes made with older parameters while we have the plaintext
+                if user.password_needs_rehash():
+                    user.set_password(password)
+                    db.session.commit()
+                    invalidate_cached_user(user.id)
+                login_user(user)
+                next_page = request.args.get('next')
+                return redirect(next_page or url_for('index'))
+        except PasswordHashBusy:
+            flash('Server is busy, please try again in a moment')
+            return render_template('login.html'), 503
         flash('Invalid username or password')
     
     return render_template('login.html')
@@ -222,7 +1026,11 @@ def signup():
             return render_template('signup.html')
         
         user = User(username=username, email=email)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHashBusy:
+            flash('Server is busy, please try again in a moment')
+            return render_template('signup.html'), 503
         
         
         if User.query.count() == 0:
@@ -230,6 +1038,7 @@ def signup():
             
         db.session.add(user)
         db.session.commit()
+        index_user_change(new_username=user.username, user_id=user.id)
         
         flash('Account created successfully! Please log in.')
         return redirect(url_for('login'))
@@ -283,6 +1092,34 @@ def get_users():
     users = User.query.all()
     return jsonify([user.to_dict() for user in users])
 
+@app.route('/api/users/directory', methods=['GET'])
+@login_required
+def get_user_directory():
+    prefix = request.args.get('q', '').strip()
+    after = request.args.get('after', '')
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    # Explicit ids let clients resolve users outside the loaded page, e.g. unread DM senders
+    ids = [user_id for user_id in request.args.get('ids', '').split(',') if user_id][:200]
+
+    # The version lives in the database, so ETags agree across workers and restarts
+    version = get_state_version('user_directory')
+    etag = hashlib.md5(f"{version}:{prefix}:{after}:{limit}:{','.join(ids)}".encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    if ids:
+        rows = db.session.query(User.id, User.username).filter(User.id.in_(ids)).all()
+        result = {'users': [{'id': user_id, 'username': username} for user_id, username in rows], 'next': None}
+    else:
+        result = search_user_directory(prefix, after, limit)
+
+    response = jsonify(result)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/api/messages/<room_id>', methods=['GET'])
 @login_required
 def get_messages(room_id):
@@ -290,17 +1127,7 @@ def get_messages(room_id):
     if not room:
         return jsonify({"error": "Room not found"}), 404
         
-    cached_messages = get_cached_messages(room_id)
-    if cached_messages:
-        return jsonify(cached_messages)
-    
-    messages = Message.query.filter_by(room_id=room_id).order_by(Message.timestamp).limit(50).all()
-    result = [message.to_dict() for message in messages]
-    
-    for message in result:
-        add_message_to_cache(room_id, message)
-        
-    return jsonify(result)
+    return jsonify(message_store.recent(room_id))
 
 @app.route('/api/direct-messages/<user_id>', methods=['GET'])
 @login_required
@@ -320,18 +1147,7 @@ def get_direct_messages(user_id):
 @app.route('/api/direct-messages/unread', methods=['GET'])
 @login_required
 def get_unread_count():
-    
-    unread_counts = {}
-    unread_messages = DirectMessage.query.filter_by(recipient_id=current_user.id, is_read=False).all()
-    
-    for msg in unread_messages:
-        sender_id = msg.sender_id
-        if sender_id in unread_counts:
-            unread_counts[sender_id] += 1
-        else:
-            unread_counts[sender_id] = 1
-    
-    return jsonify(unread_counts)
+    return jsonify(get_unread_counts(current_user.id))
 
 @app.route('/api/upload', methods=['POST'])
 @login_required
@@ -364,18 +1180,16 @@ def upload_file():
         if not room:
             return jsonify({"error": "Room not found"}), 404
             
-        message = Message(
-            content=f"Shared file: {filename}",
+        message_dict = message_store.append(
+            room_id,
+            current_user,
+            f"Shared file: {filename}",
             is_file=True,
-            file_path=unique_filename,
-            user_id=current_user.id,
-            room_id=room_id
+            file_path=unique_filename
         )
-        db.session.add(message)
-        db.session.commit()
         
         # Emit socket event for real-time updates
-        socketio.emit('message', message.to_dict(), room=room_id)
+        socketio.emit('message', message_dict, room=room_id)
         
     elif recipient_id:
         recipient = User.query.get(recipient_id)
@@ -401,6 +1215,30 @@ def upload_file():
         "file_hash": file_hash
     }), 201
 
+@app.route('/assets/<path:filename>')
+def get_asset(filename):
+    """Serve a fingerprinted asset, preferring a precompressed variant"""
+    # Variants are only served through content negotiation, and the manifest is build metadata
+    if filename.endswith(('.gz', '.br')) or filename == 'manifest.json':
+        abort(404)
+    dist = app.config['ASSET_DIST_FOLDER']
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = request.accept_encodings
+
+    served, encoding = filename, None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] and os.path.isfile(os.path.join(dist, filename + suffix)):
+            served, encoding = filename + suffix, candidate
+            break
+
+    # Names change whenever content does, so the files can be cached forever
+    response = send_from_directory(dist, served, mimetype=mimetype, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route('/uploads/<filename>')
 @login_required
 def get_upload(filename):
@@ -416,6 +1254,14 @@ def admin_panel():
         
     return render_template('admin.html')
 
+@app.route('/api/admin/stats', methods=['GET'])
+@login_required
+def admin_get_stats():
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin privileges required"}), 403
+
+    return jsonify(get_admin_stats())
+
 @app.route('/api/admin/users', methods=['GET'])
 @login_required
 def admin_get_users():
@@ -436,6 +1282,7 @@ def admin_update_user(user_id):
         return jsonify({"error": "User not found"}), 404
         
     data = request.json
+    old_username = user.username
     if 'username' in data:
         user.username = data['username']
     if 'email' in data:
@@ -443,9 +1290,16 @@ def admin_update_user(user_id):
     if 'is_admin' in data:
         user.is_admin = data['is_admin']
     if 'password' in data and data['password']:
-        user.set_password(data['password'])
+        try:
+            user.set_password(data['password'])
+        except PasswordHashBusy:
+            db.session.rollback()
+            return jsonify({"error": "Server is busy, please try again"}), 503
         
     db.session.commit()
+    invalidate_cached_user(user.id)
+    if user.username != old_username:
+        index_user_change(old_username=old_username, new_username=user.username, user_id=user.id)
     return jsonify({"message": "User updated successfully"})
 
 @app.route('/api/admin/users/<user_id>', methods=['DELETE'])
@@ -463,6 +1317,9 @@ def admin_delete_user(user_id):
         
     db.session.delete(user)
     db.session.commit()
+    invalidate_cached_user(user.id)
+    index_user_change(old_username=user.username, user_id=user.id)
+    invalidate_admin_stats()
     return jsonify({"message": "User deleted successfully"})
 
 @app.route('/api/admin/rooms', methods=['GET'])
@@ -484,13 +1341,11 @@ def admin_delete_room(room_id):
     if not room:
         return jsonify({"error": "Room not found"}), 404
         
-    Message.query.filter_by(room_id=room_id).delete()
-    
-    if room_id in message_cache:
-        del message_cache[room_id]
+    message_store.delete_room(room_id)
         
     db.session.delete(room)
     db.session.commit()
+    invalidate_admin_stats()
     return jsonify({"message": "Room deleted successfully"})
 
 @app.route('/api/admin/messages', methods=['GET'])
@@ -504,24 +1359,167 @@ def admin_get_messages():
     room_id = request.args.get('room_id')
     user_id = request.args.get('user_id')
     
-    query = Message.query
-    
-    if room_id:
-        query = query.filter_by(room_id=room_id)
-    if user_id:
-        query = query.filter_by(user_id=user_id)
-    
-    messages = query.order_by(Message.timestamp.desc()).paginate(page=page, per_page=per_page)
+    messages, total = message_store.page(room_id=room_id, user_id=user_id, page=page, per_page=per_page)
     
     result = {
-        "messages": [message.to_dict() for message in messages.items],
-        "total": messages.total,
-        "pages": messages.pages,
+        "messages": messages,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page,
         "current_page": page
     }
     
     return jsonify(result)
 
+EXPORT_FIELDS = {
+    'rooms': ['id', 'timestamp', 'room_id', 'room', 'user_id', 'username', 'content', 'is_file', 'file_path'],
+    'direct': ['id', 'timestamp', 'sender_id', 'sender', 'recipient_id', 'recipient', 'content', 'is_file', 'file_path', 'is_read']
+}
+
+def parse_export_date(value):
+    """Parse an ISO date/datetime query argument as naive UTC, None if absent"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    # Stored timestamps are naive UTC; comparing an aware value against them
+    # raises mid-stream, after the response has started
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def iter_keyset(query, model, since=None, until=None):
+    """Yield rows of `query` (id and timestamp first) in (timestamp, id) order.
+
+    Each batch is a fresh, bounded query so memory stays constant and no
+    long-lived transaction is held open while the client downloads.
+    """
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    if since:
+        query = query.filter(model.timestamp >= since)
+    if until:
+        query = query.filter(model.timestamp < until)
+
+    last = None
+    while True:
+        page = query
+        if last:
+            page = page.filter(db.or_(
+                model.timestamp > last[0],
+                db.and_(model.timestamp == last[0], model.id > last[1])
+            ))
+        rows = page.order_by(model.timestamp, model.id).limit(batch_size).all()
+        # Release the read transaction between batches
+        db.session.rollback()
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = (rows[-1][1], rows[-1][0])
+
+def iter_export_rows(source, room_id=None, user_id=None, since=None, until=None):
+    """Yield export rows in timestamp order"""
+    if source == 'rooms':
+        room_names = dict(db.session.query(Room.id, Room.name).all())
+        for record in message_store.iter_records(room_id=room_id, user_id=user_id, since=since, until=until):
+            yield {
+                'id': record['id'],
+                'timestamp': record['created_at'].strftime("%Y-%m-%d %H:%M:%S"),
+                'room_id': record['room_id'],
+                'room': room_names.get(record['room_id']),
+                'user_id': record['user_id'],
+                'username': record['username'],
+                'content': record['content'],
+                'is_file': record['is_file'],
+                'file_path': record['file_path']
+            }
+        return
+
+    sender = db.aliased(User)
+    recipient = db.aliased(User)
+    query = db.session.query(
+        DirectMessage.id, DirectMessage.timestamp,
+        DirectMessage.sender_id, sender.username,
+        DirectMessage.recipient_id, recipient.username,
+        DirectMessage.content, DirectMessage.is_file, DirectMessage.file_path, DirectMessage.is_read
+    ).join(sender, DirectMessage.sender_id == sender.id)\
+     .join(recipient, DirectMessage.recipient_id == recipient.id)
+    if user_id:
+        query = query.filter(db.or_(DirectMessage.sender_id == user_id, DirectMessage.recipient_id == user_id))
+
+    fields = EXPORT_FIELDS[source]
+    for row in iter_keyset(query, DirectMessage, since, until):
+        record = dict(zip(fields, row))
+        record['timestamp'] = record['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
+        yield record
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+def iter_csv(records, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def iter_gzip(chunks):
+    """Gzip a stream of text chunks incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/admin/messages/export', methods=['GET'])
+@login_required
+def admin_export_messages():
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin privileges required"}), 403
+
+    source = request.args.get('source', 'rooms')
+    export_format = request.args.get('format', 'ndjson')
+    use_gzip = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    room_id = request.args.get('room_id')
+    user_id = request.args.get('user_id')
+
+    if source not in EXPORT_FIELDS:
+        return jsonify({"error": "source must be 'rooms' or 'direct'"}), 400
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "format must be 'ndjson' or 'csv'"}), 400
+    if source == 'direct' and room_id:
+        return jsonify({"error": "room_id cannot be used with direct messages"}), 400
+
+    try:
+        since = parse_export_date(request.args.get('since'))
+        until = parse_export_date(request.args.get('until'))
+    except ValueError:
+        return jsonify({"error": "since/until must be ISO dates"}), 400
+
+    records = iter_export_rows(source, room_id=room_id, user_id=user_id, since=since, until=until)
+    if export_format == 'csv':
+        chunks = iter_csv(records, EXPORT_FIELDS[source])
+        mimetype = 'text/csv'
+    else:
+        chunks = iter_ndjson(records)
+        mimetype = 'application/x-ndjson'
+
+    filename = f"{source}-messages.{export_format}"
+    if use_gzip:
+        chunks = iter_gzip(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @app.route('/api/admin/files', methods=['GET'])
 @login_required
 def admin_get_files():
@@ -533,20 +1531,20 @@ def admin_get_files():
     per_page = request.args.get('per_page', 20, type=int)
     
 
-    file_messages = Message.query.filter_by(is_file=True)
+    room_names = dict(db.session.query(Room.id, Room.name).all())
     file_dms = DirectMessage.query.filter_by(is_file=True)
     
     all_files = []
     
-    for msg in file_messages.all():
+    for msg in message_store.iter_records(files_only=True):
         all_files.append({
-            "id": msg.id,
+            "id": msg["id"],
             "type": "room_message",
-            "filename": msg.file_path,
-            "original_name": msg.content.replace("Shared file: ", ""),
-            "timestamp": msg.timestamp,
-            "user": msg.author.username,
-            "room": msg.room.name if msg.room else None
+            "filename": msg["file_path"],
+            "original_name": msg["content"].replace("Shared file: ", ""),
+            "timestamp": msg["created_at"],
+            "user": msg["username"],
+            "room": room_names.get(msg["room_id"])
         })
     
     for dm in file_dms.all():
@@ -583,25 +1581,17 @@ def admin_delete_message(message_id):
     if not current_user.is_admin:
         return jsonify({"error": "Admin privileges required"}), 403
         
-    message = Message.query.get(message_id)
+    message = message_store.delete(message_id)
     if not message:
         return jsonify({"error": "Message not found"}), 404
     
     
-    if message.is_file and message.file_path:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], message.file_path)
+    if message['is_file'] and message['file_path']:
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], message['file_path'])
         if os.path.exists(file_path):
             os.remove(file_path)
     
-    
-    if message.room_id in message_cache:
-        message_cache[message.room_id] = deque(
-            [m for m in message_cache[message.room_id] if m.get('id') != message_id],
-            maxlen=max_cache_size
-        )
-    
-    db.session.delete(message)
-    db.session.commit()
+    invalidate_admin_stats()
     
     return jsonify({"message": "Message deleted successfully"})
 
@@ -612,16 +1602,15 @@ def admin_delete_file(file_id):
         return jsonify({"error": "Admin privileges required"}), 403
     
     
-    message = Message.query.filter_by(id=file_id, is_file=True).first()
+    message = message_store.get(file_id)
     
-    if message:
-        if message.file_path:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], message.file_path)
+    if message and message['is_file'] and message_store.delete(file_id):
+        if message['file_path']:
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], message['file_path'])
             if os.path.exists(file_path):
                 os.remove(file_path)
         
-        db.session.delete(message)
-        db.session.commit()
+        invalidate_admin_stats()
         
         return jsonify({"message": "File deleted successfully"})
     
@@ -637,6 +1626,7 @@ def admin_delete_file(file_id):
         
         db.session.delete(dm)
         db.session.commit()
+        invalidate_admin_stats()
         
         return jsonify({"message": "File deleted successfully"})
     
@@ -644,7 +1634,7 @@ def admin_delete_file(file_id):
 
 # Socket.IO event handlers
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     if not current_user.is_authenticated:
         return False
     
@@ -652,7 +1642,9 @@ def handle_connect():
     user_sessions[request.sid] = user_id
     
     join_room(user_id)
-    emit('connected', {'user_id': user_id})
+    
+    known_versions = auth.get('versions') if isinstance(auth, dict) else None
+    emit('connected', {'user_id': user_id, 'bootstrap': build_bootstrap(user_id, known_versions)})
 
 @socketio.on('disconnect')
 def handle_disconnect():
@@ -714,28 +1706,26 @@ def on_join(data):
     room_node.add_user(current_user.id)
     
 
-    cached_messages = get_cached_messages(room_id)
-    if cached_messages:
-        emit('chat_history', {'messages': cached_messages})
+    # A reconnecting client sends the last message it has (null if none);
+    # send only what it missed
+    rejoining = 'since_id' in data
+    since_id = data.get('since_id')
+    if not isinstance(since_id, str):
+        since_id = None
+    missed = message_store.since(room_id, since_id, app.config['RESYNC_MAX_GAP']) if since_id else None
+    if missed is not None:
+        emit('chat_history_delta', {'messages': missed, 'since_id': since_id})
     else:
-        messages = Message.query.filter_by(room_id=room_id).order_by(Message.timestamp).limit(50).all()
-        message_list = [message.to_dict() for message in messages]
-        
-        for message in message_list:
-            add_message_to_cache(room_id, message)
-            
-        emit('chat_history', {'messages': message_list})
-    
-
-    system_message = Message(
-        content=f"{current_user.username} has joined the room.",
-        user_id=current_user.id,
-        room_id=room_id
-    )
-    db.session.add(system_message)
-    db.session.commit()
+        emit('chat_history', {
+            'messages': message_store.recent(room_id),
+            'gap_too_large': bool(since_id)
+        })
     
-    emit('message', system_message.to_dict(), room=room_id)
+    # Announce real joins only; a resync after a dropped connection would
+    # otherwise store a message and move every member's cursor each time
+    if not rejoining:
+        message_dict = message_store.append(room_id, current_user, f"{current_user.username} has joined the room.")
+        emit('message', message_dict, room=room_id)
 
 @socketio.on('leave')
 def on_leave():
@@ -768,15 +1758,8 @@ def on_leave():
     session.pop('current_room', None)
     
 
-    system_message = Message(
-        content=f"{current_user.username} has left the room.",
-        user_id=current_user.id,
-        room_id=room_id
-    )
-    db.session.add(system_message)
-    db.session.commit()
-    
-    emit('message', system_message.to_dict(), room=room_id)
+    message_dict = message_store.append(room_id, current_user, f"{current_user.username} has left the room.")
+    emit('message', message_dict, room=room_id)
 
 @socketio.on('message')
 def handle_message(data):
@@ -789,18 +1772,7 @@ def handle_message(data):
     if not text:
         return
     
-    message = Message(
-        content=text,
-        user_id=current_user.id,
-        room_id=room_id
-    )
-    db.session.add(message)
-    db.session.commit()
-    
-    message_dict = message.to_dict()
-    
-
-    add_message_to_cache(room_id, message_dict)
+    message_dict = message_store.append(room_id, current_user, text)
     
     emit('message', message_dict, room=room_id)
 
@@ -825,9 +1797,9 @@ def handle_direct_message(data):
         recipient_id=recipient_id
     )
     db.session.add(dm)
-    db.session.commit()
-    
+    db.session.flush()
     dm_dict = dm.to_dict()
+    db.session.commit()
     
 
     emit('direct_message', dm_dict, room=recipient_id)
@@ -857,5 +1829,8 @@ with app.app_context():
         db.session.add(general_room)
         db.session.commit()
 
+    if app.config['MESSAGE_STORE'] == 'log':
+        check_message_log_backfill()
+
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""Append throughput and tail-read latency of the room message stores.
+
+Compares the SQLAlchemy store (with and without message_cache) against the
+append-only segment log store, using a throwaway SQLite database and log
+directory.
+
+    python benchmarks/message_store.py --messages 5000 --reads 1000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='chat-bench-')
+# Keep the benchmark away from the development database
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as chat_app
+from message_log import SegmentedMessageLog
+
+
+def bench_append(store, room_id, user, count):
+    start = time.perf_counter()
+    for i in range(count):
+        store.append(room_id, user, f"benchmark message {i}")
+    return count / (time.perf_counter() - start)
+
+
+def bench_tail(store, room_id, reads, limit, before_read=None):
+    timings = []
+    for _ in range(reads):
+        if before_read:
+            before_read()
+        start = time.perf_counter()
+        messages = store.recent(room_id, limit)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert len(messages) == limit
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--reads', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--fsync', action='store_true', help='fsync every log append')
+    args = parser.parse_args()
+
+    stores = {
+        'sql': chat_app.SQLMessageStore(),
+        'log': chat_app.SegmentLogMessageStore(
+            SegmentedMessageLog(os.path.join(WORK_DIR, 'log'), fsync=args.fsync)
+        )
+    }
+
+    print(f"messages={args.messages} reads={args.reads} limit={args.limit} fsync={args.fsync}")
+    print(f"{'store':<12} {'appends/s':>10} {'tail p50 ms':>12} {'tail p99 ms':>12}")
+
+    with chat_app.app.app_context():
+        user = chat_app.User.query.filter_by(is_admin=True).first()
+        for name, store in stores.items():
+            room = chat_app.Room(name=f"bench-{name}", created_by=user.id)
+            chat_app.db.session.add(room)
+            chat_app.db.session.commit()
+            room_id = room.id
+
+            rate = bench_append(store, room_id, user, args.messages)
+            p50, p99 = bench_tail(store, room_id, args.reads, args.limit)
+            print(f"{name:<12} {rate:>10.0f} {p50:>12.3f} {p99:>12.3f}")
+
+            if name == 'sql':
+                p50, p99 = bench_tail(store, room_id, args.reads, args.limit,
+                                      before_read=chat_app.message_cache.clear)
+                print(f"{'sql (cold)':<12} {'':>10} {p50:>12.3f} {p99:>12.3f}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
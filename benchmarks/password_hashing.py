@@ -0,0 +1,78 @@
+"""Login throughput benchmark for the password hashing pool.
+
+Simulates a burst of concurrent logins (each one a check_password call)
+against the inline path and the process pool at several worker counts,
+and reports logins per second and per core.
+
+    python benchmarks/password_hashing.py --logins 200 --workers 1 2 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the benchmark away from the development database
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+
+import app as chat_app
+
+
+def reset_pool(executor, workers):
+    if chat_app.password_pool['executor'] is not None:
+        chat_app.password_pool['executor'].shutdown()
+    chat_app.password_pool['executor'] = None
+    chat_app.app.config['PASSWORD_HASH_EXECUTOR'] = executor
+    chat_app.app.config['PASSWORD_HASH_WORKERS'] = workers
+    chat_app.app.config['PASSWORD_HASH_QUEUE_LIMIT'] = workers * 8
+
+
+def run_burst(password_hash, logins, clients):
+    """Fire `logins` password checks from `clients` request threads"""
+    def login(_):
+        while True:
+            try:
+                return chat_app.verify_password(password_hash, 'correct horse battery staple')
+            except chat_app.PasswordHashBusy:
+                time.sleep(0.001)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as request_threads:
+        results = list(request_threads.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--clients', type=int, default=32, help='concurrent request threads')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument('--method', default=chat_app.app.config['PASSWORD_HASH_METHOD'])
+    args = parser.parse_args()
+
+    password_hash = generate_password_hash('correct horse battery staple', args.method)
+    print(f"method={args.method} logins={args.logins} clients={args.clients}")
+    print(f"{'executor':<10} {'workers':>7} {'seconds':>9} {'logins/s':>10} {'logins/s/core':>14}")
+
+    reset_pool('inline', 1)
+    elapsed = run_burst(password_hash, args.logins, 1)
+    print(f"{'inline':<10} {1:>7} {elapsed:>9.2f} {args.logins / elapsed:>10.1f} {args.logins / elapsed:>14.1f}")
+
+    for workers in sorted(set(args.workers)):
+        reset_pool('process', workers)
+        # Warm the pool so process start-up is not measured
+        run_burst(password_hash, workers, workers)
+        elapsed = run_burst(password_hash, args.logins, args.clients)
+        rate = args.logins / elapsed
+        print(f"{'process':<10} {workers:>7} {elapsed:>9.2f} {rate:>10.1f} {rate / workers:>14.1f}")
+
+    reset_pool('inline', 1)
+
+
+if __name__ == '__main__':
+    main()
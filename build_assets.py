@@ -0,0 +1,159 @@
+"""Build fingerprinted, precompressed static assets.
+
+Minifies the JS/CSS under static/, writes each file to static/dist/ with a
+content hash in its name (e.g. js/chat.3f2a9c1d0b.js) alongside .gz and,
+when the `brotli` package is installed, .br variants, and records the
+mapping in static/dist/manifest.json. app.py reads the manifest so the
+templates reference the hashed files, which are served with far-future
+immutable cache headers.
+
+    python build_assets.py
+
+`rjsmin`/`rcssmin` are used for minification when installed; otherwise a
+conservative whitespace/comment stripper is applied.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+ASSETS = ['js/chat.js', 'js/admin.js', 'css/style.css', 'css/admin.css', 'css/auth.css']
+
+
+def minify_css(source):
+    if rcssmin:
+        return rcssmin.cssmin(source)
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};:,>])\s*', r'\1', source)
+    return source.replace(';}', '}').strip()
+
+
+def js_line_states(source):
+    """Yield (line, starts_in_template, ends_in_template) for each line of JS.
+
+    Tracks quotes, comments and ${...} nesting just far enough to tell
+    where template literal text spans lines. Regex literals are not
+    recognized, so one containing a quote or backtick can confuse it.
+    """
+    stack = []  # '`' while in template text, '{' for braces opened inside ${...}
+    block_comment = False
+    for line in source.splitlines():
+        starts = bool(stack) and stack[-1] == '`'
+        quote = None
+        i = 0
+        while i < len(line):
+            char, next_char = line[i], line[i + 1:i + 2]
+            if block_comment:
+                if char == '*' and next_char == '/':
+                    block_comment = False
+                    i += 1
+            elif quote:
+                if char == '\\':
+                    i += 1
+                elif char == quote:
+                    quote = None
+            elif stack and stack[-1] == '`':
+                if char == '\\':
+                    i += 1
+                elif char == '`':
+                    stack.pop()
+                elif char == '$' and next_char == '{':
+                    stack.append('{')
+                    i += 1
+            elif char in '\'"':
+                quote = char
+            elif char == '`':
+                stack.append('`')
+            elif char == '/' and next_char == '/':
+                break
+            elif char == '/' and next_char == '*':
+                block_comment = True
+                i += 1
+            elif char == '{' and stack:
+                stack.append('{')
+            elif char == '}' and stack:
+                stack.pop()
+            i += 1
+        yield line, starts, bool(stack) and stack[-1] == '`'
+
+
+def minify_js(source):
+    if rjsmin:
+        return rjsmin.jsmin(source)
+    # Without a JS parser only drop indentation and blank lines, leaving
+    # lines that continue a multi-line template literal as they are
+    lines = []
+    for line, starts_in_template, ends_in_template in js_line_states(source):
+        if not starts_in_template:
+            line = line.lstrip()
+        if not ends_in_template:
+            line = line.rstrip()
+        if line or starts_in_template:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def fingerprint(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    name, ext = os.path.splitext(path)
+    return f"{name}.{digest}{ext}"
+
+
+def write_variants(path, content):
+    """Write an asset and its precompressed siblings"""
+    target = os.path.join(DIST_DIR, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(content)
+    with open(target + '.gz', 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli:
+        with open(target + '.br', 'wb') as f:
+            f.write(brotli.compress(content, quality=11))
+
+
+def build():
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = {}
+    for path in ASSETS:
+        with open(os.path.join(STATIC_DIR, path), encoding='utf-8') as f:
+            source = f.read()
+        minified = minify_js(source) if path.endswith('.js') else minify_css(source)
+        content = minified.encode('utf-8')
+
+        hashed_path = fingerprint(path, content)
+        write_variants(hashed_path, content)
+        manifest[path] = hashed_path
+        print(f"{path} -> {hashed_path} ({len(source.encode('utf-8'))} -> {len(content)} bytes)")
+
+    with open(os.path.join(DIST_DIR, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if not brotli:
+        print("brotli not installed; skipped .br variants")
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,401 @@
+"""Append-only, segmented per-room message log.
+
+Each room gets a directory of segment files. A segment is a sequence of
+records, each a 4-byte little-endian length followed by a JSON body, and
+is sealed once it grows past `segment_max_bytes`. Next to every segment
+sits an `.idx` file of 8-byte record offsets, so record `seq` of a room is
+located with one array lookup and read through a memory map of its
+segment without scanning.
+
+    <root>/<room_id>/00000000000000000000.log   records, base seq 0
+    <root>/<room_id>/00000000000000000000.idx   uint64 offsets
+    <root>/<room_id>/00000000000000004096.log   next segment, base seq 4096
+    <root>/<room_id>/TOMBSTONES                 uint64 seqs of deleted records
+    <root>/<room_id>/<tag>.tag                  uint64 seqs of records with a tag
+
+Records are never rewritten; deleting one appends its seq to the room's
+tombstone file and reads skip it from then on. Tags given at append time
+(e.g. the author) let callers count and find records without decoding
+the whole log.
+"""
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+RECORD_HEADER = struct.Struct('<I')
+SEGMENT_SUFFIX = '.log'
+INDEX_SUFFIX = '.idx'
+LOCK_NAME = 'LOCK'
+TOMBSTONE_NAME = 'TOMBSTONES'
+TAG_SUFFIX = '.tag'
+SEQ = struct.Struct('<Q')
+ROOM_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+
+class Segment:
+    def __init__(self, path, base_seq):
+        self.path = path
+        self.base_seq = base_seq
+        self.offsets = array('Q')
+        self.size = 0
+        self._map = None
+
+    @property
+    def index_path(self):
+        return self.path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+    def load(self):
+        """Load the offset index, re-indexing any records it is missing"""
+        self.size = os.path.getsize(self.path)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            self.offsets.frombytes(data[:len(data) - len(data) % self.offsets.itemsize])
+
+        # Drop entries whose record does not fit in the log (the index page
+        # survived a crash the log page did not), then index records written
+        # after the last index entry (e.g. after a crash between the writes)
+        stale = False
+        while self.offsets and not self._fits(len(self.offsets) - 1):
+            self.offsets.pop()
+            stale = True
+        position = self._end_of(len(self.offsets) - 1) if self.offsets else 0
+        recovered = array('Q')
+        with open(self.path, 'rb') as f:
+            while position + RECORD_HEADER.size <= self.size:
+                f.seek(position)
+                (length,) = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                if position + RECORD_HEADER.size + length > self.size:
+                    break
+                recovered.append(position)
+                position += RECORD_HEADER.size + length
+
+        if position < self.size:
+            # Torn trailing write; cut it so the next append starts clean
+            with open(self.path, 'r+b') as f:
+                f.truncate(position)
+            self.size = position
+        if recovered or stale:
+            self.offsets.extend(recovered)
+            self._write_index()
+
+    def refresh(self):
+        """Pick up records another process appended since we last looked"""
+        size = os.path.getsize(self.path)
+        if size == self.size:
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(len(self.offsets) * self.offsets.itemsize)
+            data = f.read()
+        self.offsets.frombytes(data[:len(data) - len(data) % self.offsets.itemsize])
+        self.size = size
+
+    def _fits(self, index):
+        offset = self.offsets[index]
+        return offset + RECORD_HEADER.size <= self.size and self._end_of(index) <= self.size
+
+    def _end_of(self, index):
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[index])
+            (length,) = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        return self.offsets[index] + RECORD_HEADER.size + length
+
+    def _write_index(self):
+        with open(self.index_path, 'wb') as f:
+            self.offsets.tofile(f)
+
+    def append(self, payload, fsync=False):
+        offset = self.size
+        with open(self.path, 'ab') as f:
+            f.write(RECORD_HEADER.pack(len(payload)) + payload)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        with open(self.index_path, 'ab') as f:
+            f.write(struct.pack('<Q', offset))
+        self.offsets.append(offset)
+        self.size = offset + RECORD_HEADER.size + len(payload)
+
+    def read(self, start, stop):
+        """Decode records [start, stop) of this segment via its memory map"""
+        if start >= stop:
+            return []
+        view = self._mapped()
+        records = []
+        for index in range(start, stop):
+            offset = self.offsets[index]
+            (length,) = RECORD_HEADER.unpack_from(view, offset)
+            body = offset + RECORD_HEADER.size
+            records.append(json.loads(view[body:body + length]))
+        return records
+
+    def _mapped(self):
+        # Re-map once the active segment has grown past the mapped length
+        if self._map is None or len(self._map) < self.size:
+            self.close()
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class SeqSet:
+    """A sidecar file of uint64 sequence numbers, read incrementally"""
+
+    def __init__(self, path):
+        self.path = path
+        self.seqs = set()
+        self.size = 0
+
+    def refresh(self):
+        """Pick up entries appended since the last refresh, by any process"""
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(self.size)
+                data = f.read()
+            # Leave a torn trailing entry until it is complete
+            usable = len(data) - len(data) % SEQ.size
+            self.seqs.update(array('Q', data[:usable]))
+            self.size += usable
+        return self.seqs
+
+    def add(self, seq, fsync=False):
+        """Append `seq`; callers hold the room's exclusive lock"""
+        with open(self.path, 'ab') as f:
+            # Cut an entry torn by a crash so later entries stay aligned
+            end = f.seek(0, os.SEEK_END)
+            f.truncate(end - end % SEQ.size)
+            f.write(SEQ.pack(seq))
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+
+
+class RoomLog:
+    def __init__(self, directory, segment_max_bytes, fsync):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.segments = []
+        self.tombstones = SeqSet(os.path.join(directory, TOMBSTONE_NAME))
+        self.tags = {}
+
+        os.makedirs(directory, exist_ok=True)
+        # Several worker processes may share a room directory; an flock on
+        # this file serializes appends (exclusive) against reads (shared)
+        self.lock_file = open(os.path.join(directory, LOCK_NAME), 'a+b')
+        with self._locked(exclusive=True, refresh=False):
+            self._load_new_segments()
+            self.tombstones.refresh()
+
+    @contextmanager
+    def _locked(self, exclusive, refresh=True):
+        with self.lock:
+            if fcntl:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                if refresh:
+                    self._refresh()
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _load_new_segments(self):
+        last_base = self.segments[-1].base_seq if self.segments else -1
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(SEGMENT_SUFFIX) and int(name[:-len(SEGMENT_SUFFIX)]) > last_base:
+                segment = Segment(os.path.join(self.directory, name), int(name[:-len(SEGMENT_SUFFIX)]))
+                segment.load()
+                self.segments.append(segment)
+
+    def _refresh(self):
+        """Catch up with appends, new segments and deletes written by other processes"""
+        if self.segments:
+            self.segments[-1].refresh()
+        # Another writer only starts a segment once the last one is full
+        if not self.segments or self.segments[-1].size >= self.segment_max_bytes:
+            self._load_new_segments()
+        self.tombstones.refresh()
+
+    def _tag(self, tag):
+        if not ROOM_ID_PATTERN.fullmatch(tag):
+            raise ValueError(f"Invalid tag: {tag!r}")
+        if tag not in self.tags:
+            self.tags[tag] = SeqSet(os.path.join(self.directory, tag + TAG_SUFFIX))
+        return self.tags[tag]
+
+    @property
+    def next_seq(self):
+        if not self.segments:
+            return 0
+        last = self.segments[-1]
+        return last.base_seq + len(last.offsets)
+
+    def current_seq(self):
+        with self._locked(exclusive=False):
+            return self.next_seq
+
+    def count(self):
+        """Number of live (not deleted) records"""
+        with self._locked(exclusive=False):
+            return self.next_seq - len(self.tombstones.seqs)
+
+    def tagged(self, tag):
+        """Live seqs appended with `tag`, ascending"""
+        with self._locked(exclusive=False):
+            deleted = self.tombstones.seqs
+            return sorted(seq for seq in self._tag(tag).refresh() if seq not in deleted)
+
+    def append(self, record, tags=()):
+        """Append a record and return its sequence number"""
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        with self._locked(exclusive=True):
+            tag_sets = [self._tag(tag) for tag in tags]
+            seq = self.next_seq
+            if not self.segments or self.segments[-1].size >= self.segment_max_bytes:
+                path = os.path.join(self.directory, f"{seq:020d}{SEGMENT_SUFFIX}")
+                open(path, 'ab').close()
+                self.segments.append(Segment(path, seq))
+            self.segments[-1].append(payload, fsync=self.fsync)
+            for tag_set in tag_sets:
+                tag_set.add(seq, fsync=self.fsync)
+            return seq
+
+    def delete(self, seq):
+        """Tombstone record `seq`; False if it doesn't exist or is already deleted"""
+        with self._locked(exclusive=True):
+            if not 0 <= seq < self.next_seq or seq in self.tombstones.seqs:
+                return False
+            self.tombstones.add(seq, fsync=self.fsync)
+            self.tombstones.refresh()
+            return True
+
+    def read(self, start, stop):
+        """(seq, record) pairs of live records with seq in [start, stop), oldest first"""
+        with self._locked(exclusive=False):
+            return self._read(max(0, start), min(stop, self.next_seq))
+
+    def tail(self, limit):
+        with self._locked(exclusive=False):
+            records = []
+            start = self.next_seq
+            # Step back further for every deleted record in the window
+            while len(records) < limit and start > 0:
+                stop = start
+                start = max(0, stop - (limit - len(records)))
+                records[:0] = self._read(start, stop)
+            return records
+
+    def read_seqs(self, seqs):
+        """(seq, record) pairs for the given seqs, in the order given, skipping deleted ones"""
+        with self._locked(exclusive=False):
+            bases = [segment.base_seq for segment in self.segments]
+            records = []
+            for seq in seqs:
+                if not 0 <= seq < self.next_seq or seq in self.tombstones.seqs:
+                    continue
+                segment = self.segments[bisect_right(bases, seq) - 1]
+                index = seq - segment.base_seq
+                records.append((seq, segment.read(index, index + 1)[0]))
+            return records
+
+    def _read(self, start, stop):
+        records = []
+        for segment in self.segments:
+            end = segment.base_seq + len(segment.offsets)
+            if end <= start or segment.base_seq >= stop:
+                continue
+            first = max(start, segment.base_seq)
+            decoded = segment.read(first - segment.base_seq, min(stop, end) - segment.base_seq)
+            records.extend((seq, record) for seq, record in zip(range(first, first + len(decoded)), decoded)
+                           if seq not in self.tombstones.seqs)
+        return records
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.lock_file.close()
+
+
+class SegmentedMessageLog:
+    """Per-room append-only logs rooted at `root`"""
+
+    def __init__(self, root, segment_max_bytes=8 * 1024 * 1024, fsync=False):
+        self.root = root
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self.rooms = {}
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _room(self, room_id):
+        if not ROOM_ID_PATTERN.fullmatch(room_id):
+            raise ValueError(f"Invalid room id: {room_id!r}")
+        with self.lock:
+            if room_id not in self.rooms:
+                self.rooms[room_id] = RoomLog(os.path.join(self.root, room_id),
+                                              self.segment_max_bytes, self.fsync)
+            return self.rooms[room_id]
+
+    def room_ids(self):
+        """Rooms that have a log on disk"""
+        return sorted(name for name in os.listdir(self.root)
+                      if ROOM_ID_PATTERN.fullmatch(name) and os.path.isdir(os.path.join(self.root, name)))
+
+    def append(self, room_id, record, tags=()):
+        return self._room(room_id).append(record, tags)
+
+    def delete(self, room_id, seq):
+        return self._room(room_id).delete(seq)
+
+    def next_seq(self, room_id):
+        return self._room(room_id).current_seq()
+
+    def count(self, room_id):
+        return self._room(room_id).count()
+
+    def tagged(self, room_id, tag):
+        return self._room(room_id).tagged(tag)
+
+    def read_seqs(self, room_id, seqs):
+        return self._room(room_id).read_seqs(seqs)
+
+    def read(self, room_id, start, stop):
+        return self._room(room_id).read(start, stop)
+
+    def tail(self, room_id, limit):
+        """The last `limit` (seq, record) pairs of a room, oldest first"""
+        return self._room(room_id).tail(limit)
+
+    def drop_room(self, room_id):
+        if not ROOM_ID_PATTERN.fullmatch(room_id):
+            raise ValueError(f"Invalid room id: {room_id!r}")
+        with self.lock:
+            room = self.rooms.pop(room_id, None)
+        if room:
+            room.close()
+        shutil.rmtree(os.path.join(self.root, room_id), ignore_errors=True)
+
+    def close(self):
+        with self.lock:
+            for room in self.rooms.values():
+                room.close()
+            self.rooms.clear()
@@ -0,0 +1,53 @@
+"""Copy existing room messages from the database into the segment log.
+
+Run once before switching MESSAGE_STORE to log, with the same
+DATABASE_URL and MESSAGE_LOG_* settings the app will use:
+
+    python migrate_message_log.py
+
+Rows are replayed in timestamp order, keeping their timestamps and
+authors, into a staging directory that is moved to MESSAGE_LOG_FOLDER
+only once complete, so an interrupted run can simply be repeated. The
+rows stay in the database; app.py refuses to start in log mode until
+this has been run.
+"""
+import os
+import shutil
+import sys
+
+# Read through the SQL store; importing app in log mode would refuse to start
+os.environ['MESSAGE_STORE'] = 'sql'
+
+import app as chat_app
+from message_log import SegmentedMessageLog
+
+
+def migrate():
+    config = chat_app.app.config
+    target = config['MESSAGE_LOG_FOLDER']
+    if os.path.isdir(target) and os.listdir(target):
+        sys.exit(f"{target} already has logs; remove it or point MESSAGE_LOG_FOLDER elsewhere")
+    staging = target.rstrip(os.sep) + '.migrating'
+    shutil.rmtree(staging, ignore_errors=True)
+
+    with chat_app.app.app_context():
+        log = SegmentedMessageLog(staging, segment_max_bytes=config['MESSAGE_LOG_SEGMENT_BYTES'])
+        store = chat_app.SegmentLogMessageStore(log)
+        count = 0
+        for record in chat_app.SQLMessageStore().iter_records():
+            store.import_record(record)
+            count += 1
+        log.close()
+        # Everything is on disk before the log goes live and the app is told so
+        os.sync()
+
+        if os.path.isdir(target):
+            os.rmdir(target)
+        os.rename(staging, target)
+        chat_app.bump_state_version('message_log_backfill')
+
+    print(f"Copied {count} messages into {target}")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -5,6 +5,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const totalRoomsElement = document.getElementById('total-rooms');
     const totalMessagesElement = document.getElementById('total-messages');
     const totalFilesElement = document.getElementById('total-files');
+    const totalStorageElement = document.getElementById('total-storage');
+    const roomActivityList = document.getElementById('room-activity-list');
     const usersList = document.getElementById('users-list');
     const roomsList = document.getElementById('rooms-list');
     const messagesList = document.getElementById('messages-list');
@@ -25,37 +27,27 @@ document.addEventListener('DOMContentLoaded', () => {
     const fileTypeFilter = document.getElementById('file-type-filter');
     const closeBtns = document.querySelectorAll('.close-btn');
 
-    loadDashboardData();
-
     let users = [];
     let rooms = [];
     let messages = [];
     let files = [];
-    let messageTotal = 0;
-    let filesTotal = 0;
+    let stats = null;
+    let listsLoaded = false;
     let currentUserId = null;
-    
-    checkApiEndpoints();
-        
-    function checkApiEndpoints() {
-        Promise.all([
-            fetch('/api/admin/messages').then(res => res.ok),
-            fetch('/api/admin/files').then(res => res.ok)
-        ])
-        .then(([messagesOk, filesOk]) => {
-            if (!messagesOk) {
-                showNotification('Message moderation API endpoint is not available. Some features may not work.', 'warning');
-                document.querySelector('[data-section="messages"]').classList.add('disabled');
-            }
-            
-            if (!filesOk) {
-                showNotification('File management API endpoint is not available. Some features may not work.', 'warning');
-                document.querySelector('[data-section="files"]').classList.add('disabled');
-            }
-        })
-        .catch(() => {
-            showNotification('Could not check API availability. Some features may not work.', 'warning');
-        });
+
+    // The dashboard only needs counts; the management lists are fetched
+    // the first time one of their sections is opened.
+    function loadStats() {
+        fetch('/api/admin/stats')
+            .then(res => res.json())
+            .then(data => {
+                stats = data;
+                updateDashboard();
+            })
+            .catch(error => {
+                console.error('Error loading admin stats:', error);
+                showNotification('Failed to load dashboard stats. Please refresh.', 'error');
+            });
     }
 
     function loadDashboardData() {
@@ -69,11 +61,9 @@ document.addEventListener('DOMContentLoaded', () => {
             users = usersData;
             rooms = roomsData;
             messages = messagesData.messages || [];
-            messageTotal = messagesData.total || 0;
             files = filesData.files || [];
-            filesTotal = filesData.total || 0;
+            listsLoaded = true;
             
-            updateDashboard();
             updateUsersList();
             updateRoomsList();
             updateMessagesList();
@@ -87,10 +77,36 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function updateDashboard() {
-        totalUsersElement.textContent = users.length;
-        totalRoomsElement.textContent = rooms.length;
-        totalMessagesElement.textContent = messageTotal || 'N/A';
-        totalFilesElement.textContent = filesTotal || 'N/A';
+        if (!stats) return;
+
+        totalUsersElement.textContent = stats.users;
+        totalRoomsElement.textContent = stats.rooms;
+        totalMessagesElement.textContent = stats.messages;
+        totalFilesElement.textContent = stats.files;
+        totalStorageElement.textContent = formatBytes(stats.storage_bytes);
+
+        roomActivityList.innerHTML = '';
+        stats.room_activity.forEach(room => {
+            const row = document.createElement('tr');
+            row.innerHTML = `
+                <td>${room.name}</td>
+                <td>${room.messages_last_hour}</td>
+                <td>${room.active_users}</td>
+            `;
+            roomActivityList.appendChild(row);
+        });
+    }
+
+
+    function formatBytes(bytes) {
+        const units = ['B', 'KB', 'MB', 'GB'];
+        let value = bytes;
+        let unit = 0;
+        while (value >= 1024 && unit < units.length - 1) {
+            value /= 1024;
+            unit++;
+        }
+        return `${value.toFixed(unit ? 1 : 0)} ${units[unit]}`;
     }
 
 
@@ -278,7 +294,6 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-r
     function editUser(user) {
         document.getElementById('user-username').value = user.username;
         document.getElementById('user-email').value = user.email;
@@ -343,6 +358,7 @@ r
         })
         .then(() => {
             loadDashboardData();
+            loadStats();
             userModal.style.display = 'none';
             showNotification(currentUserId ? 'User updated successfully' : 'User created successfully', 'success');
         })
@@ -369,6 +385,7 @@ r
             .then(data => {
                 users = users.filter(user => user.id !== userId);
                 updateUsersList();
+                loadStats();
                 showNotification('User deleted successfully', 'success');
             })
             .catch(error => {
@@ -417,6 +434,7 @@ r
         })
         .then(() => {
             loadDashboardData();
+            loadStats();
             roomModal.style.display = 'none';
             showNotification('Room created successfully', 'success');
         })
@@ -442,6 +460,7 @@ r
         })
         .then(() => {
             loadDashboardData();
+            loadStats();
             showNotification('Room deleted successfully', 'success');
         })
         .catch(error => {
@@ -467,6 +486,7 @@ r
         })
         .then(() => {
             loadDashboardData();
+            loadStats();
             showNotification('Message deleted successfully', 'success');
         })
         .catch(error => {
@@ -496,6 +516,7 @@ r
         })
         .then(() => {
             loadDashboardData();
+            loadStats();
             showNotification('File deleted successfully', 'success');
         })
         .catch(error => {
@@ -531,6 +552,10 @@ r
             item.classList.add('active');
             const sectionId = item.getAttribute('data-section');
             document.getElementById(sectionId).classList.add('active');
+
+            if (sectionId !== 'dashboard' && !listsLoaded) {
+                loadDashboardData();
+            }
         });
     });
 
@@ -576,15 +601,5 @@ r
     userForm.addEventListener('submit', saveUser);
     roomForm.addEventListener('submit', saveRoom);
 
-    loadDashboardData();
-
-    fetch('/api/admin/messages')
-        .catch(() => {
-            showNotification('Message moderation API endpoint is not implemented in the backend.', 'warning');
-        });
-        
-    fetch('/api/admin/files')
-        .catch(() => {
-            showNotification('File management API endpoint is not implemented in the backend.', 'warning');
-        });
+    loadStats();
 });
\ No newline at end of file
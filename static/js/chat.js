@@ -39,21 +39,35 @@ document.addEventListener('DOMContentLoaded', () => {
     let activeTab = 'rooms';
     let rooms = [];
     let users = [];
+    let usersNextCursor = null;
+    let userSearchTimer = null;
     let unreadCounts = {};
+    let unreadSenders = [];
+    let onlineUsers = new Set();
+    let lastMessageId = null;
     let socket = null;
 
+    const bootstrapKey = `chat-bootstrap:${document.querySelector('.username').textContent}`;
+    let bootstrapCache = loadBootstrapCache();
+
     function initializeSocket() {
-        socket = io();
+        // Send the section versions we already hold; the server omits unchanged ones
+        socket = io({
+            auth: (cb) => cb({ versions: bootstrapCache.versions || {} })
+        });
 
         socket.on('connect', () => {
             console.log('Connected to server');
-            loadRooms();
-            loadUsers();
-            loadUnreadCounts();
+
+            // Room membership is lost on reconnect; rejoin and fetch only what we missed
+            if (currentRoom) {
+                socket.emit('join', { room_id: currentRoom.id, since_id: lastMessageId });
+            }
         });
 
         socket.on('connected', (data) => {
             currentUser = data.user_id;
+            applyBootstrap(data.bootstrap);
         });
 
         socket.on('message', (data) => {
@@ -82,12 +96,55 @@ document.addEventListener('DOMContentLoaded', () => {
             displayMessages(data.messages);
         });
 
+        socket.on('chat_history_delta', (data) => {
+            data.messages.forEach(message => {
+                appendMessage(message);
+            });
+            scrollToBottom();
+        });
+
         socket.on('error', (data) => {
             showNotification(data.message, 'error');
         });
     }
 
 
+    function loadBootstrapCache() {
+        try {
+            return JSON.parse(localStorage.getItem(bootstrapKey)) || {};
+        } catch (error) {
+            return {};
+        }
+    }
+
+
+    function applyBootstrap(bootstrap) {
+        ['rooms', 'users', 'unread', 'presence'].forEach(section => {
+            if (section in bootstrap) {
+                bootstrapCache[section] = bootstrap[section];
+            }
+        });
+        bootstrapCache.versions = bootstrap.versions;
+
+        try {
+            localStorage.setItem(bootstrapKey, JSON.stringify(bootstrapCache));
+        } catch (error) {
+            console.warn('Could not persist bootstrap cache:', error);
+        }
+
+        rooms = bootstrapCache.rooms || [];
+        unreadCounts = bootstrapCache.unread || {};
+        onlineUsers = new Set(bootstrapCache.presence || []);
+        if (!userSearch.value.trim() && bootstrapCache.users) {
+            users = bootstrapCache.users.users;
+            usersNextCursor = bootstrapCache.users.next;
+        }
+
+        updateRoomsList();
+        loadUnreadSenders();
+    }
+
+
     function loadRooms() {
         fetch('/api/rooms')
             .then(response => response.json())
@@ -102,11 +159,22 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
 
-    function loadUsers() {
-        fetch('/api/users')
+    // Users are paged from the server-side directory; the browser revalidates
+    // each page with its ETag so unchanged pages come back as 304s.
+    function loadUsers(append = false) {
+        const params = new URLSearchParams({ limit: 50 });
+        if (userSearch.value.trim()) {
+            params.set('q', userSearch.value.trim());
+        }
+        if (append && usersNextCursor) {
+            params.set('after', usersNextCursor);
+        }
+
+        fetch(`/api/users/directory?${params}`)
             .then(response => response.json())
             .then(data => {
-                users = data;
+                users = append ? users.concat(data.users) : data.users;
+                usersNextCursor = data.next;
                 updateUsersList();
             })
             .catch(error => {
@@ -121,7 +189,7 @@ document.addEventListener('DOMContentLoaded', () => {
             .then(response => response.json())
             .then(data => {
                 unreadCounts = data;
-                updateUsersList();
+                loadUnreadSenders();
             })
             .catch(error => {
                 console.error('Error loading unread counts:', error);
@@ -129,6 +197,27 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
 
+    // Senders of unread DMs may be outside the loaded directory page; fetch them so they are listed
+    function loadUnreadSenders() {
+        const known = new Set(users.concat(unreadSenders).map(user => user.id));
+        const missing = Object.keys(unreadCounts).filter(id => !known.has(id));
+        if (!missing.length) {
+            updateUsersList();
+            return;
+        }
+
+        fetch(`/api/users/directory?ids=${encodeURIComponent(missing.join(','))}`)
+            .then(response => response.json())
+            .then(data => {
+                unreadSenders = unreadSenders.concat(data.users);
+                updateUsersList();
+            })
+            .catch(error => {
+                console.error('Error loading unread senders:', error);
+            });
+    }
+
+
     function updateRoomsList() {
         roomsList.innerHTML = '';
         
@@ -162,15 +251,20 @@ document.addEventListener('DOMContentLoaded', () => {
     function updateUsersList() {
         usersList.innerHTML = '';
         
-        const filteredUsers = userSearch.value ? 
-            users.filter(user => user.username.toLowerCase().includes(userSearch.value.toLowerCase())) : 
-            users;
+        const pageIds = new Set(users.map(user => user.id));
+        const query = userSearch.value.trim().toLowerCase();
+        const pinnedSenders = unreadSenders.filter(user =>
+            unreadCounts[user.id] && !pageIds.has(user.id) && user.username.toLowerCase().startsWith(query)
+        );
         
-        filteredUsers.forEach(user => {
+        pinnedSenders.concat(users).forEach(user => {
             if (user.id === currentUser) return;
             
             const userElement = document.createElement('div');
             userElement.className = 'user-item';
+            if (onlineUsers.has(user.id)) {
+                userElement.classList.add('online');
+            }
             if (currentDMUser && currentDMUser.id === user.id) {
                 userElement.classList.add('active');
             }
@@ -189,12 +283,21 @@ document.addEventListener('DOMContentLoaded', () => {
             
             usersList.appendChild(userElement);
         });
+
+        if (usersNextCursor) {
+            const loadMoreElement = document.createElement('button');
+            loadMoreElement.className = 'load-more-btn';
+            loadMoreElement.textContent = 'Load more';
+            loadMoreElement.addEventListener('click', () => loadUsers(true));
+            usersList.appendChild(loadMoreElement);
+        }
     }
 
 
     function joinRoom(room) {
         currentRoom = room;
         currentDMUser = null;
+        lastMessageId = null;
         
 
         messagesContainer.innerHTML = '';
@@ -253,6 +356,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     function displayMessages(messages) {
         messagesContainer.innerHTML = '';
+        lastMessageId = null;
         messages.forEach(message => {
             appendMessage(message);
         });
@@ -270,6 +374,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
     function appendMessage(message) {
+        if (message.id) {
+            lastMessageId = message.id;
+        }
+
         const messageElement = document.createElement('div');
         messageElement.className = 'message';
         
@@ -658,7 +766,10 @@ document.addEventListener('DOMContentLoaded', () => {
     roomSearch.addEventListener('input', updateRoomsList);
     
 
-    userSearch.addEventListener('input', updateUsersList);
+    userSearch.addEventListener('input', () => {
+        clearTimeout(userSearchTimer);
+        userSearchTimer = setTimeout(() => loadUsers(), 250);
+    });
     
 
     attachmentBtn.addEventListener('click', () => {
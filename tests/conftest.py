@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# app.py configures itself from the environment when imported, so point it
+# at a throwaway database before any test imports it
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'chat.db'))
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+os.environ.setdefault('MESSAGE_LOG_FOLDER', os.path.join(tempfile.mkdtemp(), 'message_log'))
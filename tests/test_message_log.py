@@ -0,0 +1,130 @@
+import os
+
+from message_log import SegmentedMessageLog
+
+
+def segment_paths(root, room_id):
+    directory = os.path.join(root, room_id)
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.log'))
+
+
+def test_append_and_read_across_segments(tmp_path):
+    log = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    for i in range(20):
+        assert log.append('room', {'i': i}) == i
+
+    assert len(segment_paths(str(tmp_path), 'room')) > 1
+    assert [record['i'] for _, record in log.tail('room', 5)] == list(range(15, 20))
+    assert [seq for seq, _ in log.read('room', 3, 9)] == list(range(3, 9))
+    log.close()
+
+    reopened = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    assert reopened.next_seq('room') == 20
+
+
+def test_index_entry_for_truncated_record_is_dropped(tmp_path):
+    log = SegmentedMessageLog(str(tmp_path))
+    for i in range(3):
+        log.append('room', {'i': i})
+    log.close()
+
+    # The index page survived but the tail of the log page did not
+    segment = segment_paths(str(tmp_path), 'room')[-1]
+    with open(segment, 'r+b') as f:
+        f.truncate(os.path.getsize(segment) - 5)
+
+    log = SegmentedMessageLog(str(tmp_path))
+    assert [record['i'] for _, record in log.tail('room', 10)] == [0, 1]
+    assert log.append('room', {'i': 'new'}) == 2
+    log.close()
+
+    log = SegmentedMessageLog(str(tmp_path))
+    assert [record['i'] for _, record in log.tail('room', 10)] == [0, 1, 'new']
+
+
+def test_unindexed_and_torn_records_are_recovered(tmp_path):
+    log = SegmentedMessageLog(str(tmp_path))
+    for i in range(3):
+        log.append('room', {'i': i})
+    log.close()
+
+    segment = segment_paths(str(tmp_path), 'room')[-1]
+    index = segment[:-len('.log')] + '.idx'
+    with open(index, 'r+b') as f:
+        f.truncate(8)
+    with open(segment, 'ab') as f:
+        f.write(b'\x50\x00\x00\x00{"torn')
+
+    log = SegmentedMessageLog(str(tmp_path))
+    assert [record['i'] for _, record in log.tail('room', 10)] == [0, 1, 2]
+    assert log.append('room', {'i': 3}) == 3
+    assert [record['i'] for _, record in log.tail('room', 2)] == [2, 3]
+
+
+def test_writers_sharing_a_directory_see_each_other(tmp_path):
+    first = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    second = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+
+    written = []
+    for i in range(10):
+        writer, name = (first, f"a{i}") if i % 2 == 0 else (second, f"b{i}")
+        assert writer.append('room', {'name': name}) == i
+        written.append(name)
+
+    for log in (first, second):
+        assert log.next_seq('room') == 10
+        assert [record['name'] for _, record in log.read('room', 0, 10)] == written
+        assert [record['name'] for _, record in log.tail('room', 3)] == written[-3:]
+
+    first.close()
+    second.close()
+    reopened = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    assert [record['name'] for _, record in reopened.read('room', 0, 100)] == written
+
+
+def test_deleted_records_are_skipped_by_every_reader(tmp_path):
+    first = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    second = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    for i in range(10):
+        first.append('room', {'i': i})
+
+    assert first.delete('room', 8)
+    assert first.delete('room', 9)
+    assert not first.delete('room', 9)
+    assert not first.delete('room', 10)
+
+    for log in (first, second):
+        assert [record['i'] for _, record in log.tail('room', 3)] == [5, 6, 7]
+        assert [seq for seq, _ in log.read('room', 6, 10)] == [6, 7]
+
+    assert second.delete('room', 0)
+    # Sequence numbers are never reused
+    assert first.append('room', {'i': 'next'}) == 10
+    first.close()
+    second.close()
+
+    reopened = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    assert reopened.room_ids() == ['room']
+    assert [seq for seq, _ in reopened.read('room', 0, 100)] == [1, 2, 3, 4, 5, 6, 7, 10]
+
+
+def test_tags_index_live_records(tmp_path):
+    first = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    second = SegmentedMessageLog(str(tmp_path), segment_max_bytes=64)
+    for i in range(6):
+        writer = first if i % 2 else second
+        writer.append('room', {'i': i}, tags=['even' if i % 2 == 0 else 'odd', 'all'])
+    first.delete('room', 4)
+
+    assert second.tagged('room', 'even') == [0, 2]
+    assert first.tagged('room', 'all') == [0, 1, 2, 3, 5]
+    assert first.tagged('room', 'missing') == []
+    assert first.count('room') == 5
+    assert [record['i'] for _, record in second.read_seqs('room', [5, 4, 0])] == [5, 0]
+
+    # A torn tag entry is skipped by readers and cut by the next writer
+    with open(os.path.join(str(tmp_path), 'room', 'odd.tag'), 'ab') as f:
+        f.write(b'\x01\x02')
+    assert SegmentedMessageLog(str(tmp_path)).tagged('room', 'odd') == [1, 3, 5]
+    first.append('room', {'i': 6}, tags=['odd'])
+    assert SegmentedMessageLog(str(tmp_path)).tagged('room', 'odd') == [1, 3, 5, 6]
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import SegmentLogMessageStore
+from message_log import SegmentedMessageLog
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SegmentLogMessageStore(SegmentedMessageLog(str(tmp_path), segment_max_bytes=4096))
+
+
+def author(name):
+    return SimpleNamespace(id=f"{name}-id", username=name)
+
+
+def count_decoded(store, monkeypatch):
+    decoded = []
+    for name in ('read', 'read_seqs'):
+        original = getattr(store.log, name)
+
+        def counting(*args, original=original):
+            records = original(*args)
+            decoded.extend(records)
+            return records
+        monkeypatch.setattr(store.log, name, counting)
+    return decoded
+
+
+def test_admin_views_read_only_what_they_need(store, monkeypatch):
+    alice, bob = author('alice'), author('bob')
+    for i in range(300):
+        store.append('lobby', alice if i % 3 else bob, f"lobby {i}")
+        store.append('games', alice, f"games {i}")
+    store.append('games', bob, 'Shared file: a.txt', is_file=True, file_path='a.txt')
+    store.delete('lobby:3')
+
+    decoded = count_decoded(store, monkeypatch)
+    messages, total = store.page(per_page=10)
+    assert total == 600
+    assert len(messages) == 10 and messages[0]['content'] == 'Shared file: a.txt'
+    assert len(decoded) <= 40
+
+    del decoded[:]
+    messages, total = store.page(user_id='bob-id', page=2, per_page=5)
+    assert total == 100
+    assert all(message['username'] == 'bob' for message in messages)
+    assert len(decoded) <= 20
+
+    del decoded[:]
+    files = list(store.iter_records(files_only=True))
+    assert [record['file_path'] for record in files] == ['a.txt']
+    assert len(decoded) == 1
+
+    del decoded[:]
+    stats = store.stats(datetime.utcnow() + timedelta(hours=1))
+    assert (stats['messages'], stats['files'], stats['activity']) == (600, 1, {})
+    assert len(decoded) <= 2 * 256
+
+
+def test_imported_records_keep_their_timestamps(store):
+    created_at = datetime(2024, 5, 1, 12, 30, 15)
+    imported = store.import_record({
+        'room_id': 'lobby', 'user_id': 'alice-id', 'username': 'alice', 'content': 'from sql',
+        'is_file': False, 'file_path': None, 'created_at': created_at
+    })
+    store.append('lobby', author('bob'), 'live')
+
+    assert imported == {'id': 'lobby:0', 'content': 'from sql', 'timestamp': '12:30:15', 'date': '2024-05-01',
+                        'username': 'alice', 'is_file': False, 'file_path': None}
+    assert store.get('lobby:0')['created_at'] == created_at
+    assert store.page(user_id='alice-id')[1] == 1
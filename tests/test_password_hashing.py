@@ -0,0 +1,41 @@
+import os
+import signal
+import time
+
+import pytest
+
+import app as chat_app
+from app import PasswordHashBusy, run_password_task
+
+
+def die():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.fixture
+def process_pool(monkeypatch):
+    monkeypatch.setitem(chat_app.app.config, 'PASSWORD_HASH_EXECUTOR', 'process')
+    monkeypatch.setitem(chat_app.app.config, 'PASSWORD_HASH_WORKERS', 1)
+    yield
+    if chat_app.password_pool['executor'] is not None:
+        chat_app.password_pool['executor'].shutdown()
+    chat_app.password_pool['executor'] = None
+
+
+def test_pool_recovers_after_a_worker_is_killed(process_pool):
+    assert run_password_task(pow, 2, 10) == 1024
+    executor = chat_app.password_pool['executor']
+    for process in list(executor._processes.values()):
+        process.kill()
+        process.join()
+    time.sleep(0.1)
+
+    # Retried on a fresh pool rather than failing with BrokenProcessPool
+    assert run_password_task(pow, 2, 11) == 2048
+    assert chat_app.password_pool['executor'] is not executor
+
+
+def test_task_that_keeps_breaking_the_pool_reports_busy(process_pool):
+    with pytest.raises(PasswordHashBusy):
+        run_password_task(die)
+    assert run_password_task(pow, 3, 2) == 9
@@ -0,0 +1,90 @@
+import uuid
+
+import pytest
+
+import app as chat_app
+
+
+@pytest.fixture
+def room():
+    with chat_app.app.app_context():
+        admin = chat_app.User.query.filter_by(username='admin').first()
+        room = chat_app.Room(name=f"resync-{uuid.uuid4().hex[:8]}", created_by=admin.id)
+        chat_app.db.session.add(room)
+        chat_app.db.session.commit()
+        return room.id
+
+
+def connect():
+    client = chat_app.app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    socket = chat_app.socketio.test_client(chat_app.app, flask_test_client=client)
+    socket.get_received()
+    return socket
+
+
+def events(socket, name):
+    return [event['args'][0] if isinstance(event['args'], list) else event['args']
+            for event in socket.get_received() if event['name'] == name]
+
+
+def join_and_send(socket, room, count):
+    socket.emit('join', {'room_id': room})
+    socket.emit('message', {'text': 'first'})
+    sent = events(socket, 'message')
+    for i in range(count):
+        socket.emit('message', {'text': f"missed {i}"})
+    socket.get_received()
+    return sent[-1]['id']
+
+
+def test_delta_served_from_cache(room):
+    socket = connect()
+    cursor = join_and_send(socket, room, 3)
+
+    socket.emit('join', {'room_id': room, 'since_id': cursor})
+    (delta,) = events(socket, 'chat_history_delta')
+    assert [message['content'] for message in delta['messages']] == ['missed 0', 'missed 1', 'missed 2']
+
+
+def test_delta_falls_back_to_database(room):
+    socket = connect()
+    cursor = join_and_send(socket, room, 2)
+    chat_app.message_cache.pop(room, None)
+
+    socket.emit('join', {'room_id': room, 'since_id': cursor})
+    (delta,) = events(socket, 'chat_history_delta')
+    assert [message['content'] for message in delta['messages']] == ['missed 0', 'missed 1']
+
+
+def test_gap_too_large_sends_full_history(room, monkeypatch):
+    monkeypatch.setitem(chat_app.app.config, 'RESYNC_MAX_GAP', 2)
+    socket = connect()
+    cursor = join_and_send(socket, room, 3)
+
+    socket.emit('join', {'room_id': room, 'since_id': cursor})
+    (history,) = events(socket, 'chat_history')
+    assert history['gap_too_large']
+    assert history['messages'][-1]['content'] == 'missed 2'
+
+
+def test_unknown_cursor_sends_full_history(room):
+    socket = connect()
+    join_and_send(socket, room, 1)
+
+    for since_id in ('no-such-message', 42):
+        socket.emit('join', {'room_id': room, 'since_id': since_id})
+        (history,) = events(socket, 'chat_history')
+        assert history['gap_too_large'] == isinstance(since_id, str)
+
+
+def test_rejoin_is_not_announced(room):
+    socket = connect()
+    watcher = connect()
+    watcher.emit('join', {'room_id': room})
+    cursor = join_and_send(socket, room, 0)
+    watcher.get_received()
+
+    socket.emit('join', {'room_id': room, 'since_id': cursor})
+    socket.emit('join', {'room_id': room, 'since_id': None})
+    assert events(watcher, 'message') == []
@@ -0,0 +1,42 @@
+import app as chat_app
+
+
+def test_invalidation_from_another_worker_evicts_cached_identities(monkeypatch):
+    monkeypatch.setitem(chat_app.app.config, 'USER_CACHE_SYNC_INTERVAL', 0)
+    with chat_app.app.app_context():
+        user = chat_app.User(username='moderator', email='moderator@example.com',
+                             password_hash='x', is_admin=True)
+        chat_app.db.session.add(user)
+        chat_app.db.session.commit()
+        user_id = user.id
+        chat_app.db.session.remove()
+
+        assert chat_app.load_user(user_id).is_admin
+        assert user_id in chat_app.user_cache
+        chat_app.db.session.remove()
+
+        # Another worker demotes the user and publishes the invalidation
+        chat_app.User.query.filter_by(id=user_id).update({'is_admin': False})
+        chat_app.db.session.commit()
+        chat_app.bump_state_version('user_identity')
+        chat_app.db.session.remove()
+
+        assert not chat_app.load_user(user_id).is_admin
+
+
+def test_own_invalidation_keeps_other_cached_identities(monkeypatch):
+    monkeypatch.setitem(chat_app.app.config, 'USER_CACHE_SYNC_INTERVAL', 0)
+    with chat_app.app.app_context():
+        users = [chat_app.User(username=f'member{i}', email=f'member{i}@example.com', password_hash='x')
+                 for i in range(2)]
+        chat_app.db.session.add_all(users)
+        chat_app.db.session.commit()
+        first, second = [user.id for user in users]
+
+        chat_app.load_user(first)
+        chat_app.load_user(second)
+        chat_app.invalidate_cached_user(first)
+        chat_app.load_user(second)
+
+        assert first not in chat_app.user_cache
+        assert second in chat_app.user_cache
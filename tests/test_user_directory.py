@@ -0,0 +1,71 @@
+import pytest
+
+import app as chat_app
+from app import UsernameTrie
+
+
+@pytest.fixture
+def trie():
+    trie = UsernameTrie()
+    for user_id, username in [('1', 'alice'), ('2', 'Alina'), ('3', 'alan'), ('4', 'bob'),
+                              ('5', 'al'), ('6', 'alice')]:
+        trie.insert(username, user_id)
+    return trie
+
+
+def keys(results):
+    return [(key, user_id) for key, user_id, _ in results]
+
+
+def test_search_orders_by_key_then_id(trie):
+    assert keys(trie.search('al')) == [('al', '5'), ('alan', '3'), ('alice', '1'), ('alice', '6'), ('alina', '2')]
+    assert keys(trie.search('ALI')) == [('alice', '1'), ('alice', '6'), ('alina', '2')]
+    assert trie.search('carol') == []
+
+
+def test_search_pages_with_after_cursor(trie):
+    first = trie.search('', limit=3)
+    assert keys(first) == [('al', '5'), ('alan', '3'), ('alice', '1')]
+    second = trie.search('', after=keys(first)[-1], limit=3)
+    assert keys(second) == [('alice', '6'), ('alina', '2'), ('bob', '4')]
+    assert trie.search('', after=('bob', '4')) == []
+
+
+def test_search_skips_subtrees_before_cursor(trie):
+    visited = []
+
+    class Node(dict):
+        def get(self, key, default=None):
+            visited.append(self.path)
+            return super().get(key, default)
+
+    def wrap(node, path):
+        wrapped = Node({char: wrap(child, path + char) if char is not None else child
+                        for char, child in node.items()})
+        wrapped.path = path
+        return wrapped
+
+    trie.root = wrap(trie.root, '')
+    assert keys(trie.search('', after=('alice', '6'), limit=2)) == [('alina', '2'), ('bob', '4')]
+    # Nothing under "ala..." sorts after the cursor, so that branch is never entered
+    assert 'ala' not in visited and 'alan' not in visited
+
+
+def test_remove_keeps_other_users_with_the_same_name(trie):
+    trie.remove('alice', '1')
+    trie.remove('alice', 'missing')
+    assert keys(trie.search('alice')) == [('alice', '6')]
+    assert trie.size == 5
+
+
+def test_directory_rebuilds_after_another_worker_changes_users():
+    with chat_app.app.app_context():
+        chat_app.get_user_index()
+        # A signup handled by another worker: the row and the shared version
+        # change, but this process's trie was never patched
+        user = chat_app.User(username='zed-remote', email='zed@example.com', password_hash='x')
+        chat_app.db.session.add(user)
+        chat_app.db.session.commit()
+        chat_app.bump_state_version('user_directory')
+
+        assert [u['username'] for u in chat_app.search_user_directory('zed')['users']] == ['zed-remote']